@@ -1,3 +1,11 @@
+from array import array
+
+# NumPy is optional, PixelArray falls back to array
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # Colors
 BLACK = 0x000000
 RED = 0x200000
@@ -26,6 +34,10 @@ BLUE_MASK = 0x0000FF
 BLUE_SHIFT = 0
 COMPONENT_MAX = 0xFF
 
+# Out of range modes
+MODE_SKIP = 0
+MODE_CLAMP = 1
+
 
 class Pixel:
 
@@ -156,3 +168,308 @@ class Pixel:
             return
 
         self.setblue(new_blue)
+
+
+class PixelArray:
+
+    def __init__(self, length, initial_color=BLACK, use_numpy=True):
+        """
+        Constructor, stores each channel in its own buffer so channel operations run over all pixels at once
+        :param length: Number of pixels
+        :param initial_color: Sets the initial 24 bit color of every pixel
+        :param use_numpy: Use NumPy buffers when NumPy is installed
+        """
+
+        self.length = length
+        self.use_numpy = use_numpy and numpy is not None
+
+        # Channel buffers by shift
+        self.channels = {}
+        for shift in (RED_SHIFT, GREEN_SHIFT, BLUE_SHIFT):
+
+            if self.use_numpy:
+                self.channels[shift] = numpy.zeros(length, dtype=numpy.int16)
+            else:
+                self.channels[shift] = array("h", [0]) * length
+
+        self.fill(initial_color)
+
+    def __len__(self):
+
+        return self.length
+
+    def getcolor(self, index):
+        """
+        Gets the full 24 bit color value of one pixel
+        :param index: Pixel index
+        :return: Color
+        """
+
+        return (int(self.channels[RED_SHIFT][index]) << RED_SHIFT) | \
+               (int(self.channels[GREEN_SHIFT][index]) << GREEN_SHIFT) | \
+               (int(self.channels[BLUE_SHIFT][index]) << BLUE_SHIFT)
+
+    def setcolor(self, index, color):
+        """
+        Sets the full 24 bit color value of one pixel
+        :param index: Pixel index
+        :param color: The 24 bit RGB value
+        :return: None
+        """
+
+        for shift in (RED_SHIFT, GREEN_SHIFT, BLUE_SHIFT):
+            self.channels[shift][index] = (color >> shift) & COMPONENT_MAX
+
+    def getcolors(self):
+        """
+        Gets the 24 bit color values of all pixels
+        :return: NumPy uint32 array, or array('I') without NumPy
+        """
+
+        red = self.channels[RED_SHIFT]
+        green = self.channels[GREEN_SHIFT]
+        blue = self.channels[BLUE_SHIFT]
+
+        if self.use_numpy:
+            return (red.astype(numpy.uint32) << RED_SHIFT) | (green.astype(numpy.uint32) << GREEN_SHIFT) | \
+                   (blue.astype(numpy.uint32) << BLUE_SHIFT)
+
+        return array("I", [(r << RED_SHIFT) | (g << GREEN_SHIFT) | (b << BLUE_SHIFT)
+                           for r, g, b in zip(red, green, blue)])
+
+    def fill(self, color):
+        """
+        Sets every pixel to the same 24 bit color
+        :param color: The 24 bit RGB value
+        :return: None
+        """
+
+        for shift in (RED_SHIFT, GREEN_SHIFT, BLUE_SHIFT):
+            self.setchannel(shift, (color >> shift) & COMPONENT_MAX)
+
+    def setchannel(self, shift, value, indexes=None):
+        """
+        Sets one component of many pixels
+        :param shift: RED_SHIFT, GREEN_SHIFT or BLUE_SHIFT
+        :param value: The component value
+        :param indexes: Pixel indexes to change, None for all
+        :return: None
+        """
+
+        channel = self.channels[shift]
+        value = COMPONENT_MAX & value
+
+        if indexes is None:
+            indexes = range(self.length)
+
+        if self.use_numpy:
+            channel[numpy.asarray(indexes, dtype=numpy.intp)] = value
+            return
+
+        for index in indexes:
+            channel[index] = value
+
+    def modifychannel(self, shift, change, mode=MODE_SKIP, indexes=None):
+        """
+        Modifies one component of many pixels by change delta
+        :param shift: RED_SHIFT, GREEN_SHIFT or BLUE_SHIFT
+        :param change: value of change, can be positive or negative
+        :param mode: MODE_SKIP leaves pixels that would go out of range unchanged like Pixel,
+                     MODE_CLAMP saturates them at the component limits
+        :param indexes: Pixel indexes to change, None for all
+        :return: None
+        """
+
+        self.applychannel(shift, lambda value: value + change, mode, indexes)
+
+    def scalechannel(self, shift, factor, mode=MODE_SKIP, indexes=None):
+        """
+        Scales one component of many pixels
+        :param shift: RED_SHIFT, GREEN_SHIFT or BLUE_SHIFT
+        :param factor: Multiplier, the result is truncated
+        :param mode: MODE_SKIP or MODE_CLAMP, see modifychannel
+        :param indexes: Pixel indexes to change, None for all
+        :return: None
+        """
+
+        if self.use_numpy:
+            self.applychannel(shift, lambda value: (value * factor).astype(numpy.int32), mode, indexes)
+        else:
+            self.applychannel(shift, lambda value: int(value * factor), mode, indexes)
+
+    def applychannel(self, shift, operation, mode, indexes):
+        """
+        Applies an operation to one component of many pixels with the out of range mode
+        :param shift: RED_SHIFT, GREEN_SHIFT or BLUE_SHIFT
+        :param operation: Function from old component values to new ones
+        :param mode: MODE_SKIP or MODE_CLAMP
+        :param indexes: Pixel indexes to change, None for all
+        :return: None
+        """
+
+        channel = self.channels[shift]
+
+        if self.use_numpy:
+
+            selection = slice(None) if indexes is None else numpy.asarray(indexes, dtype=numpy.intp)
+            old = channel[selection]
+            new = operation(old.astype(numpy.int32))
+
+            if mode == MODE_CLAMP:
+                channel[selection] = numpy.clip(new, COMPONENT_MIN, COMPONENT_MAX)
+            else:
+                channel[selection] = numpy.where((new >= COMPONENT_MIN) & (new <= COMPONENT_MAX), new, old)
+
+            return
+
+        if indexes is None:
+            indexes = range(self.length)
+
+        for index in indexes:
+
+            new = operation(channel[index])
+
+            if COMPONENT_MIN <= new <= COMPONENT_MAX:
+                channel[index] = new
+
+            elif mode == MODE_CLAMP:
+                channel[index] = COMPONENT_MIN if new < COMPONENT_MIN else COMPONENT_MAX
+
+    def modifyred(self, change, mode=MODE_SKIP, indexes=None):
+        """
+        Modifies red component of many pixels by change delta
+        :param change: value of change, can be positive or negative
+        :param mode: MODE_SKIP or MODE_CLAMP, see modifychannel
+        :param indexes: Pixel indexes to change, None for all
+        :return: None
+        """
+
+        self.modifychannel(RED_SHIFT, change, mode, indexes)
+
+    def modifygreen(self, change, mode=MODE_SKIP, indexes=None):
+        """
+        Modifies green component of many pixels by change delta
+        :param change: value of change, can be positive or negative
+        :param mode: MODE_SKIP or MODE_CLAMP, see modifychannel
+        :param indexes: Pixel indexes to change, None for all
+        :return: None
+        """
+
+        self.modifychannel(GREEN_SHIFT, change, mode, indexes)
+
+    def modifyblue(self, change, mode=MODE_SKIP, indexes=None):
+        """
+        Modifies blue component of many pixels by change delta
+        :param change: value of change, can be positive or negative
+        :param mode: MODE_SKIP or MODE_CLAMP, see modifychannel
+        :param indexes: Pixel indexes to change, None for all
+        :return: None
+        """
+
+        self.modifychannel(BLUE_SHIFT, change, mode, indexes)
+
+    def scale(self, factor, mode=MODE_CLAMP, indexes=None):
+        """
+        Scales all components of many pixels, used for dimming
+        :param factor: Multiplier, the result is truncated
+        :param mode: MODE_SKIP or MODE_CLAMP, see modifychannel
+        :param indexes: Pixel indexes to change, None for all
+        :return: None
+        """
+
+        for shift in (RED_SHIFT, GREEN_SHIFT, BLUE_SHIFT):
+            self.scalechannel(shift, factor, mode, indexes)
+
+
+class ColorCorrection:
+
+    def __init__(self, brightness=BRIGHT_MAX, gamma=1.0, use_numpy=True):
+        """
+        Constructor, precomputes a 256 entry table per channel so correcting a color is three lookups
+        :param brightness: Master level, BRIGHT_MAX leaves colors at full strength
+        :param gamma: Gamma exponent, 1.0 is linear and around 2.2 looks even to the eye
+        :param use_numpy: Use NumPy tables when NumPy is installed
+        """
+
+        self.brightness = max(BRIGHT_OFF, min(brightness, BRIGHT_MAX))
+        self.gamma = gamma
+        self.use_numpy = use_numpy and numpy is not None
+
+        # Corrected component for each component value
+        self.levels = [int(round(((value / COMPONENT_MAX) ** gamma) * self.brightness))
+                       for value in range(COMPONENT_MAX + 1)]
+
+        # Tables already shifted into place, a corrected color is the three lookups or'd together
+        self.red_table = [level << RED_SHIFT for level in self.levels]
+        self.green_table = [level << GREEN_SHIFT for level in self.levels]
+        self.blue_table = [level << BLUE_SHIFT for level in self.levels]
+
+        if self.use_numpy:
+            self.red_table = numpy.array(self.red_table, dtype=numpy.uint32)
+            self.green_table = numpy.array(self.green_table, dtype=numpy.uint32)
+            self.blue_table = numpy.array(self.blue_table, dtype=numpy.uint32)
+
+    def isidentity(self):
+        """
+        Checks if the correction leaves every color as it is
+        :return: True if correcting changes nothing
+        """
+
+        return self.levels == list(range(COMPONENT_MAX + 1))
+
+    def correct(self, color):
+        """
+        Corrects one color
+        :param color: The 24 bit RGB value
+        :return: Corrected 24 bit color
+        """
+
+        return int(self.red_table[(color >> RED_SHIFT) & COMPONENT_MAX] |
+                   self.green_table[(color >> GREEN_SHIFT) & COMPONENT_MAX] |
+                   self.blue_table[color & COMPONENT_MAX])
+
+    def correctrange(self, colors, output, start, end):
+        """
+        Corrects a range of colors into another buffer
+        :param colors: Buffer of 24 bit colors, a NumPy uint32 array when using NumPy
+        :param output: Buffer of the same kind to write to
+        :param start: First index
+        :param end: Index after the last
+        :return: None
+        """
+
+        if self.use_numpy:
+            values = colors[start:end]
+            output[start:end] = self.red_table[values >> RED_SHIFT] | \
+                self.green_table[(values >> GREEN_SHIFT) & COMPONENT_MAX] | \
+                self.blue_table[values & COMPONENT_MAX]
+            return
+
+        red_table = self.red_table
+        green_table = self.green_table
+        blue_table = self.blue_table
+        output[start:end] = array("I", [red_table[color >> RED_SHIFT] |
+                                        green_table[(color >> GREEN_SHIFT) & COMPONENT_MAX] |
+                                        blue_table[color & COMPONENT_MAX] for color in colors[start:end]])
+
+    def correctindexes(self, colors, output, indexes):
+        """
+        Corrects the colors at some indexes into another buffer
+        :param colors: Buffer of 24 bit colors, a NumPy uint32 array when using NumPy
+        :param output: Buffer of the same kind to write to
+        :param indexes: Pixel indexes, a NumPy index array when using NumPy
+        :return: None
+        """
+
+        if self.use_numpy:
+            values = colors[indexes]
+            output[indexes] = self.red_table[values >> RED_SHIFT] | \
+                self.green_table[(values >> GREEN_SHIFT) & COMPONENT_MAX] | \
+                self.blue_table[values & COMPONENT_MAX]
+            return
+
+        for index in indexes:
+            color = colors[index]
+            output[index] = self.red_table[color >> RED_SHIFT] | \
+                self.green_table[(color >> GREEN_SHIFT) & COMPONENT_MAX] | \
+                self.blue_table[color & COMPONENT_MAX]
@@ -0,0 +1,352 @@
+import asyncio
+import os
+from collections import deque
+import lightingController as lc
+
+
+# controller class to manage the neopixels from an asyncio event loop
+# The serial port's file descriptor is registered with the loop, so this needs a POSIX selector loop
+# Coroutines that block in LightingController have their own names, the blocking versions run them on the loop
+# so timelines, effects and show files can drive the controller from another thread
+class AsyncLightingController(lc.LightingController):
+
+    # Constants
+    READ_SIZE = 4096
+    RESPONSE_TIMEOUT = 1.0
+
+    def __init__(self, port=None, length=None, color=None, use_numpy=False):
+
+        super(AsyncLightingController, self).__init__(port=port, length=length, color=color, use_numpy=use_numpy)
+
+        # Event loop state
+        self.loop = None
+        self.fd = None
+        self.read_buffer = b""
+
+        # Futures waiting for a line in send order, and lines nobody waited for yet
+        self.pending_lines = deque()
+        self.unclaimed_lines = deque()
+
+    # Keeps up to window_size slow commands in flight, there is no reader thread to start
+    def enablewindowedmode(self, window_size=1):
+
+        self.window_size = max(window_size, 1)
+
+    # Opens the port and registers it with the running event loop
+    async def open(self, autodetect=False):
+
+        self.loop = asyncio.get_running_loop()
+
+        # Probing ports blocks, keep it off the loop, the detected port is left open
+        if autodetect:
+
+            if not await self.loop.run_in_executor(None, self.autodetectport):
+                return False
+
+        elif self.port is None:
+            return False
+
+        else:
+            self.ser.port = self.port
+            self.ser.open()
+
+        self.ser.timeout = 0
+
+        self.fd = self.ser.fileno()
+        os.set_blocking(self.fd, False)
+        self.loop.add_reader(self.fd, self.onreadable)
+        return True
+
+    # Starts communication and shows the initial color
+    async def begin(self, autodetect=False):
+
+        # Validate user settings
+        if self.length is None:
+            return False
+
+        if not await self.open(autodetect=autodetect):
+            return False
+
+        # Check port, autodetection already read READY
+        if not autodetect:
+
+            result = await self.readline()
+            if result != self.COM_READY:
+                self.end()
+                return False
+
+        # Set color if necessary
+        if self.color is None:
+            self.color = self.BLACK
+
+        # The device starts with an empty palette
+        self.palette.reset()
+
+        # Send length
+        if not await self.asendslowcommand(self.create_command_init()):
+            self.end()
+            return False
+
+        # Update the pixels
+        if not await self.asendslowcommand(self.COM_UPDATE):
+            self.end()
+            return False
+
+        # Success
+        return True
+
+    # Closes the serial port
+    def end(self):
+
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            self.loop.remove_writer(self.fd)
+            self.fd = None
+
+        # Nothing will answer the outstanding commands now
+        while len(self.pending_lines) > 0:
+            future = self.pending_lines.popleft()
+            if not future.done():
+                future.cancel()
+
+        self.ser.close()
+
+    # Splits incoming data into lines, called by the event loop
+    def onreadable(self):
+
+        try:
+            data = os.read(self.fd, self.READ_SIZE)
+        except BlockingIOError:
+            return
+
+        self.read_buffer += data
+        while b"\n" in self.read_buffer:
+
+            line, separator, self.read_buffer = self.read_buffer.partition(b"\n")
+            self.dispatchline(line + separator)
+
+    # Hands a line to the oldest waiting future
+    def dispatchline(self, line):
+
+        if len(self.pending_lines) == 0:
+            self.unclaimed_lines.append(line)
+            return
+
+        # Futures that timed out still take their late response so later ones stay in step
+        future = self.pending_lines.popleft()
+        if not future.done():
+            future.set_result(line)
+
+    # Claims the next line, the future resolves when it arrives
+    def expectline(self):
+
+        future = self.loop.create_future()
+        if len(self.unclaimed_lines) > 0:
+            future.set_result(self.unclaimed_lines.popleft())
+
+        else:
+            self.pending_lines.append(future)
+
+        return future
+
+    # Reads the next line, empty if it doesn't arrive within RESPONSE_TIMEOUT
+    async def readline(self):
+
+        return await self.waitforline(self.expectline())
+
+    # Waits for a claimed line, a timed out future keeps its place in the queue
+    async def waitforline(self, future):
+
+        try:
+            return await asyncio.wait_for(future, self.RESPONSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return b""
+
+    # Writes all the data, waiting on the event loop whenever the port is full
+    async def write(self, data):
+
+        data = memoryview(data)
+        while len(data) > 0:
+
+            try:
+                written = os.write(self.fd, data)
+            except BlockingIOError:
+                written = 0
+
+            data = data[written:]
+            if len(data) > 0:
+                await self.writable()
+
+    # Waits until the port accepts more data
+    async def writable(self):
+
+        future = self.loop.create_future()
+
+        def onwritable():
+            if not future.done():
+                future.set_result(None)
+
+        self.loop.add_writer(self.fd, onwritable)
+        try:
+            await future
+        finally:
+            self.loop.remove_writer(self.fd)
+
+    # Sends a command in slow mode
+    async def asendslowcommand(self, command):
+
+        future = self.expectline()
+        await self.write(command)
+        result = await self.waitforline(future)
+
+        if result == self.COM_RECEIVED:
+            return True
+        else:
+            return False
+
+    # Sends slow commands keeping up to window_size in flight, returns False if any were invalid
+    async def asendslowcommands(self, commands):
+
+        success = True
+        in_flight = deque()
+        for command in commands:
+
+            # Wait for the oldest command when the window is full
+            if len(in_flight) >= self.window_size:
+                if await self.waitforline(in_flight.popleft()) != self.COM_RECEIVED:
+                    success = False
+
+            in_flight.append(self.expectline())
+            await self.write(command)
+
+        while len(in_flight) > 0:
+            if await self.waitforline(in_flight.popleft()) != self.COM_RECEIVED:
+                success = False
+
+        return success
+
+    # Sends updated buffer and shows all pixels, nothing is sent if no pixel changed
+    # A ControllerGroup passes a barrier every port waits at between sending and showing
+    async def update(self, barrier=None):
+
+        changed = self.changedpixels()
+        if len(changed) == 0:
+            self.copytorecordbuffer()
+            await self.waitatbarrier(barrier)
+            return
+
+        colors = self.correctpixels(changed)
+        if self.fast_mode:
+
+            # Fast lines end with the show command, frame and palette commands show on receipt
+            data = self.encodechanges(changed, colors)
+            await self.waitatbarrier(barrier)
+            await self.write(data)
+
+        else:
+
+            # The show command goes in the same window as the pixels unless other ports have to catch up
+            commands = self.planner.planslow(colors, changed, self.length)
+            if barrier is None:
+                commands.append(self.COM_UPDATE)
+
+            await self.asendslowcommands(commands)
+            if barrier is not None:
+                await self.waitatbarrier(barrier)
+                await self.asendslowcommand(self.COM_UPDATE)
+
+        self.copytorecordbuffer()
+
+    # Waits at a ControllerGroup's barrier without blocking the loop
+    async def waitatbarrier(self, barrier):
+
+        if barrier is not None:
+            await self.loop.run_in_executor(None, barrier.wait)
+
+    # Sends command to update neopixels
+    async def show(self):
+
+        if self.fast_mode:
+            await self.write(self.COM_UPDATE_FAST)
+
+        else:
+            await self.asendslowcommand(self.COM_UPDATE)
+
+    # Turns fast mode on or off
+    async def aenablefastmode(self, fast_mode=False):
+
+        # Check if already in mode
+        if fast_mode == self.fast_mode:
+            return
+
+        # Change mode
+        if fast_mode:
+            await self.asendslowcommand(self.COM_ENTER_FAST)
+
+        else:
+            await self.asendslowcommand(self.COM_EXIT_FAST)
+
+        # Update mode
+        self.fast_mode = fast_mode
+
+        # Frame and palette mode need fast mode
+        if not fast_mode:
+            self.frame_mode = False
+            self.palette_mode = False
+
+    # Reliable mode reads acknowledgements on a thread, which the event loop can't share the port with
+    def enablereliablemode(self, reliable_mode=False):
+
+        if reliable_mode:
+            raise RuntimeError("AsyncLightingController has no reliable mode")
+
+    # Sends whole frames as one binary command instead of one line per pixel
+    async def aenableframemode(self, frame_mode=False):
+
+        if frame_mode:
+            await self.aenablefastmode(fast_mode=True)
+
+        self.frame_mode = frame_mode
+
+    # Sends pixels as 1 byte palette slots, uploading colors to the device as they are needed
+    async def aenablepalettemode(self, palette_mode=False):
+
+        if palette_mode:
+            await self.aenablefastmode(fast_mode=True)
+
+        self.palette_mode = palette_mode
+
+    # Runs a coroutine on the controller's loop and waits for its result, for blocking callers on other threads
+    def runblocking(self, coroutine):
+
+        if self.loop is None:
+            coroutine.close()
+            raise RuntimeError("AsyncLightingController isn't open, await begin() first")
+
+        # Blocking on the loop's own thread would stop the loop the result comes from
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self.loop:
+            coroutine.close()
+            raise RuntimeError("Blocking AsyncLightingController calls can't run on its event loop, await them instead")
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    # Sends updated buffer and shows all pixels from another thread
+    def updatepixels(self, barrier=None):
+
+        self.runblocking(self.update(barrier))
+
+    # Sends a command in slow mode from another thread, the mode switches and slow show go through here
+    def sendslowcommand(self, command):
+
+        return self.runblocking(self.asendslowcommand(command))
+
+    # The writer thread would write to the port behind the event loop
+    def enablebackgroundmode(self, queue_size=0):
+
+        if queue_size > 0:
+            raise RuntimeError("AsyncLightingController has no background mode, await update() instead")
@@ -0,0 +1,253 @@
+"""
+Benchmark suite for the controller and the Falcon sequences, run against the firmware emulator
+Run with: python benchmark.py [--output results.json] [--sequences takingoff landing ...]
+"""
+
+import argparse
+import json
+import platform
+import time
+import timeit
+from datetime import datetime
+import emulator
+import falcon
+import lightingController as lc
+
+# Sequences that run by default, the endless ones are left out
+SEQUENCES = ["enginekill", "startupengines", "takingoff", "losingpower", "restartengines", "fireeverything",
+             "landing", "gotohyperspace"]
+
+# Modes as (fast mode, frame mode, palette mode, window size)
+MODES = {
+    "slow": (False, False, False, 1),
+    "slow_windowed": (False, False, False, 8),
+    "fast": (True, False, False, 1),
+    "frame": (True, True, False, 1),
+    "palette": (True, False, True, 1),
+}
+
+ENCODE_NUMBER = 2000
+SETTLE_TIMEOUT = 5.0
+
+
+def setmode(con, mode):
+    """
+    Puts a controller in one of the benchmark modes
+    :param con: LightingController
+    :param mode: Key of MODES
+    :return: None
+    """
+
+    fast_mode, frame_mode, palette_mode, window_size = MODES[mode]
+    con.enablewindowedmode(window_size=window_size)
+    con.enablefastmode(fast_mode=fast_mode)
+    con.enableframemode(frame_mode=frame_mode)
+    con.enablepalettemode(palette_mode=palette_mode)
+
+
+def fillframe(con, frame):
+    """
+    Changes every pixel so each frame sends the whole strip
+    :param con: LightingController
+    :param frame: Frame number
+    :return: None
+    """
+
+    count = 0
+    while count < con.length:
+        con.setpixelcolor(count, (frame * 0x010203 + count) & con.BITS24)
+        count += 1
+
+
+def benchmarkencode(length):
+    """
+    Times encoding a frame with every pixel changed, no port is opened
+    :param length: Number of pixels
+    :return: Dictionary of results by mode
+    """
+
+    con = lc.LightingController(length=length)
+    fillframe(con, 1)
+    changed = con.changedpixels()
+
+    results = {}
+    for mode in ["slow", "fast", "frame", "palette"]:
+
+        con.fast_mode, con.frame_mode, con.palette_mode, window_size = MODES[mode]
+        if mode == "slow":
+            encode = lambda: [con.encoder.encodeslow(count, con.pixel_buffer[count]) for count in changed]
+            frame_bytes = sum(len(command) for command in encode()) + len(con.COM_UPDATE)
+        elif mode == "palette":
+            encode = lambda: con.planner.planpalette(con.pixel_buffer, changed, con.palette)
+            frame_bytes = len(encode())
+        else:
+            encode = lambda: con.encodepixels(con.pixel_buffer, changed)
+            frame_bytes = len(encode())
+
+        seconds = min(timeit.repeat(encode, repeat=3, number=ENCODE_NUMBER)) / ENCODE_NUMBER
+        results[mode] = {"encode_us_per_frame": seconds * 1e6, "bytes_per_frame": frame_bytes}
+
+    return results
+
+
+def waitforshows(device, shows):
+    """
+    Waits until the emulator has shown a number of frames, fast modes never wait for responses
+    :param device: DeviceEmulator
+    :param shows: Show count to wait for
+    :return: None
+    """
+
+    deadline = time.monotonic() + SETTLE_TIMEOUT
+    while device.shows < shows and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def benchmarkthroughput(device, port, length, frames):
+    """
+    Measures full strip frames per second in every mode
+    :param device: Running DeviceEmulator
+    :param port: The emulator's port
+    :param length: Number of pixels
+    :param frames: Frames to send per mode
+    :return: Dictionary of results by mode
+    """
+
+    con = lc.LightingController(port=port, length=length)
+    if not con.begin():
+        raise RuntimeError("Emulator did not start")
+
+    results = {}
+    for mode in MODES:
+
+        setmode(con, mode)
+        bytes_before = device.bytes_received
+        shows_before = device.shows
+
+        start = time.monotonic()
+        frame = 0
+        while frame < frames:
+            fillframe(con, frame + 1)
+            con.updatepixels()
+            frame += 1
+
+        if con.window_size > 1:
+            con.flushcommands()
+
+        waitforshows(device, shows_before + frames)
+        elapsed = time.monotonic() - start
+
+        results[mode] = {
+            "frames": frames,
+            "seconds": elapsed,
+            "frames_per_second": frames / elapsed,
+            "wire_bytes_per_frame": (device.bytes_received - bytes_before) / frames,
+        }
+
+    con.end()
+
+    # Give the emulator time to see the port close before it is opened again
+    time.sleep(emulator.DeviceEmulator.RESET_TIME)
+
+    return results
+
+
+def benchmarksequences(device, port, sequences, mode):
+    """
+    Runs Falcon sequences and compares the wall clock time with the nominal time
+    :param device: Running DeviceEmulator
+    :param port: The emulator's port
+    :param sequences: Names of MillenniumFalcon methods
+    :param mode: Key of MODES
+    :return: Dictionary of results by sequence
+    """
+
+    mf = falcon.MillenniumFalcon(port)
+    fast_mode, frame_mode, palette_mode, window_size = MODES[mode]
+    mf.enablewindowedmode(window_size=window_size)
+    mf.enablefastmode(fast_mode=fast_mode)
+    mf.enableframemode(frame_mode=frame_mode)
+    mf.enablepalettemode(palette_mode=palette_mode)
+
+    results = {}
+    for name in sequences:
+
+        shows_before = device.shows
+        bytes_before = device.bytes_received
+
+        mf.startshow()
+        getattr(mf, name)()
+        stats = mf.endshow()
+
+        results[name] = {
+            "seconds": stats["elapsed"],
+            "nominal_seconds": stats["nominal"],
+            "ratio": stats["elapsed"] / stats["nominal"] if stats["nominal"] > 0 else None,
+            "frames_sent": stats["frames_sent"],
+            "frames_dropped": stats["frames_dropped"],
+            "achieved_fps": stats["achieved_fps"],
+            "frames_shown": device.shows - shows_before,
+            "wire_bytes": device.bytes_received - bytes_before,
+        }
+
+    mf.con.end()
+    return results
+
+
+def runbenchmarks(arguments):
+    """
+    Runs the whole suite
+    :param arguments: Parsed command line arguments
+    :return: Dictionary of results
+    """
+
+    device = emulator.DeviceEmulator(baudrate=arguments.baudrate, ack_latency=arguments.ack_latency,
+                                     processing_time=arguments.processing_time)
+    port = device.start()
+
+    try:
+
+        results = {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "config": {
+                "baudrate": arguments.baudrate,
+                "ack_latency": arguments.ack_latency,
+                "processing_time": arguments.processing_time,
+                "length": arguments.length,
+                "frames": arguments.frames,
+                "sequence_mode": arguments.mode,
+            },
+            "encode": benchmarkencode(arguments.length),
+            "throughput": benchmarkthroughput(device, port, arguments.length, arguments.frames),
+            "sequences": benchmarksequences(device, port, arguments.sequences, arguments.mode),
+        }
+
+    finally:
+        device.stop()
+
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the lighting controller against the emulator")
+    parser.add_argument("--output", default=None, help="JSON file to write, defaults to a timestamped name")
+    parser.add_argument("--sequences", nargs="*", default=SEQUENCES, help="Falcon sequences to time")
+    parser.add_argument("--mode", choices=sorted(MODES), default="slow", help="Mode the sequences run in")
+    parser.add_argument("--length", type=int, default=falcon.STRIP_LENGTH, help="Pixels per frame")
+    parser.add_argument("--frames", type=int, default=100, help="Frames per throughput run")
+    parser.add_argument("--baudrate", type=int, default=lc.LightingController.BAUDRATE)
+    parser.add_argument("--ack-latency", type=float, default=0.0005)
+    parser.add_argument("--processing-time", type=float, default=0.0001)
+    args = parser.parse_args()
+
+    output = args.output
+    if output is None:
+        output = "benchmark-" + datetime.now().strftime("%Y%m%d-%H%M%S") + ".json"
+
+    benchmark_results = runbenchmarks(args)
+    with open(output, "w") as output_file:
+        json.dump(benchmark_results, output_file, indent=2)
+
+    print(json.dumps(benchmark_results, indent=2))
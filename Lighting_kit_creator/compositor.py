@@ -0,0 +1,248 @@
+import RGB
+from scheduler import FrameScheduler
+from timeline import interpolate
+
+# Blend modes
+# Replace: the layer's color wins, opacity is ignored
+# Add: components are added, clamped at full
+# Max: the brighter of each component wins
+# Alpha: the layer's color is mixed over the layers below by opacity
+REPLACE = "replace"
+ADD = "add"
+MAX = "max"
+ALPHA = "alpha"
+
+
+def addcolors(below, color):
+    """
+    Adds two colors component by component, clamped at full
+    :param below: 24 bit color
+    :param color: 24 bit color
+    :return: 24 bit color
+    """
+
+    result = 0
+    for shift in (RGB.RED_SHIFT, RGB.GREEN_SHIFT, RGB.BLUE_SHIFT):
+        component = ((below >> shift) & RGB.COMPONENT_MAX) + ((color >> shift) & RGB.COMPONENT_MAX)
+        result |= min(component, RGB.COMPONENT_MAX) << shift
+
+    return result
+
+
+def maxcolors(below, color):
+    """
+    Keeps the brighter of each component
+    :param below: 24 bit color
+    :param color: 24 bit color
+    :return: 24 bit color
+    """
+
+    result = 0
+    for shift in (RGB.RED_SHIFT, RGB.GREEN_SHIFT, RGB.BLUE_SHIFT):
+        result |= max((below >> shift) & RGB.COMPONENT_MAX, (color >> shift) & RGB.COMPONENT_MAX) << shift
+
+    return result
+
+
+# one effect in the compositor's stack
+class Layer:
+
+    def __init__(self, frames, length, group=None, mode=REPLACE, opacity=1.0, hold=True):
+        """
+        Constructor
+        :param frames: Iterable of effects frames
+        :param length: Number of pixels
+        :param group: PixelGroup the layer may draw on, None for every pixel
+        :param mode: REPLACE, ADD, MAX or ALPHA
+        :param opacity: 0.0 to 1.0, how much of the blended color shows over the layers below
+        :param hold: Keep showing the last frame after the effect ends, False to remove the layer
+        """
+
+        self.frames = iter(frames)
+        self.mode = mode
+        self.opacity = opacity
+        self.hold = hold
+
+        # Pixels the layer may draw on
+        self.indexes = range(length) if group is None else group.getindexes()
+
+        # What the layer shows, None where it hasn't drawn
+        self.colors = [None] * length
+        self.remaining = 0.0
+        self.exhausted = False
+
+    def advance(self, elapsed):
+        """
+        Moves the effect forward, frames shorter than a tick still leave their colors behind
+        :param elapsed: Seconds since the last advance
+        :return: None
+        """
+
+        self.remaining -= elapsed
+        while self.remaining <= 0 and not self.exhausted:
+
+            frame = next(self.frames, None)
+            if frame is None:
+                self.exhausted = True
+                break
+
+            for index, color in enumerate(frame.colors):
+                if color is not None:
+                    self.colors[index] = color
+
+            self.remaining += frame.duration
+
+    def isfinished(self):
+        """
+        Checks if the effect has played out
+        :return: True once the last frame's duration has passed
+        """
+
+        return self.exhausted and self.remaining <= 0
+
+    def draw(self, colors):
+        """
+        Blends the layer onto the colors of the layers below
+        :param colors: List of 24 bit colors, changed in place
+        :return: None
+        """
+
+        layer_colors = self.colors
+        mode = self.mode
+        opacity = self.opacity
+
+        for index in self.indexes:
+
+            color = layer_colors[index]
+            if color is None:
+                continue
+
+            below = colors[index]
+            if mode == REPLACE:
+                colors[index] = color
+                continue
+
+            if mode == ADD:
+                color = addcolors(below, color)
+            elif mode == MAX:
+                color = maxcolors(below, color)
+
+            colors[index] = color if opacity >= 1.0 else interpolate(below, color, opacity)
+
+
+# runs a stack of effect layers on one controller, one merged update per tick
+class Compositor:
+
+    # Constants
+    DEFAULT_FPS = 40
+
+    def __init__(self, controller, fps=DEFAULT_FPS):
+        """
+        Constructor, pixels no layer draws on keep the colors they have now
+        :param controller: LightingController the merged frames are sent to
+        :param fps: Ticks per second
+        """
+
+        self.controller = controller
+        self.fps = fps
+        self.length = controller.length
+
+        # Bottom layer first
+        self.layers = []
+        self.base = [int(color) for color in controller.pixel_buffer[:self.length]]
+
+    def addlayer(self, frames, group=None, mode=REPLACE, opacity=1.0, hold=True):
+        """
+        Adds a layer on top of the stack
+        :param frames: Iterable of effects frames
+        :param group: PixelGroup the layer may draw on, None for every pixel
+        :param mode: REPLACE, ADD, MAX or ALPHA
+        :param opacity: 0.0 to 1.0, how much of the blended color shows over the layers below
+        :param hold: Keep showing the last frame after the effect ends, False to remove the layer
+        :return: The Layer
+        """
+
+        layer = Layer(frames, self.length, group=group, mode=mode, opacity=opacity, hold=hold)
+        self.layers.append(layer)
+        return layer
+
+    def removelayer(self, layer):
+        """
+        Removes a layer, the pixels it drew on show the layers below again
+        :param layer: Layer from addlayer
+        :return: None
+        """
+
+        self.layers.remove(layer)
+
+    def setbase(self, color):
+        """
+        Sets the color under every layer
+        :param color: 24 bit color
+        :return: None
+        """
+
+        self.base = [color] * self.length
+
+    def isfinished(self):
+        """
+        Checks if every layer has played out
+        :return: True when no layer has frames left
+        """
+
+        return all(layer.isfinished() for layer in self.layers)
+
+    def compose(self):
+        """
+        Merges the layers from the bottom up
+        :return: List of 24 bit colors
+        """
+
+        colors = list(self.base)
+        for layer in self.layers:
+            layer.draw(colors)
+
+        return colors
+
+    def tick(self, elapsed):
+        """
+        Advances every layer and sends the merged frame with a single update
+        :param elapsed: Seconds since the last tick
+        :return: None
+        """
+
+        for layer in self.layers:
+            layer.advance(elapsed)
+
+        # Layers that ended without hold stop drawing
+        self.layers = [layer for layer in self.layers if layer.hold or not layer.isfinished()]
+
+        self.controller.setpixelcolors(range(self.length), self.compose())
+        self.controller.updatepixels()
+
+    def run(self, scheduler=None, duration=None):
+        """
+        Ticks until every layer has played out
+        :param scheduler: FrameScheduler to tick on, None to start a new one
+        :param duration: Seconds to stop after, None to run until the layers finish
+        :return: None
+        """
+
+        if scheduler is None:
+            scheduler = FrameScheduler()
+            scheduler.start()
+
+        period = 1.0 / self.fps
+        last = None
+
+        def render(frame):
+
+            nonlocal last
+
+            # Frames skipped while running late still move the layers, so the show keeps to wall time
+            self.tick(0.0 if last is None else (frame - last) * period)
+            last = frame
+
+            return not self.isfinished() and (duration is None or frame * period < duration)
+
+        scheduler.run(render, fps=self.fps)
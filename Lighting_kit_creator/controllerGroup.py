@@ -0,0 +1,159 @@
+import threading
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+
+# drives several controllers on separate ports as one long strip
+class ControllerGroup:
+
+    # Constants
+    SHOW_TIMEOUT = 5.0
+
+    def __init__(self, controllers):
+        """
+        Constructor, logical pixels are numbered through the controllers in order
+        :param controllers: LightingController objects with their lengths set
+        """
+
+        self.controllers = list(controllers)
+        if len(self.controllers) == 0:
+            raise ValueError("A ControllerGroup needs at least one controller")
+
+        # First logical pixel of each controller
+        self.offsets = []
+        offset = 0
+        for controller in self.controllers:
+            self.offsets.append(offset)
+            offset += controller.length
+
+        self.length = offset
+
+        # One worker per port so every port can wait at the show barrier at once
+        self.pool = ThreadPoolExecutor(max_workers=len(self.controllers))
+
+    def locate(self, pixel):
+        """
+        Finds the controller that owns a logical pixel
+        :param pixel: Logical pixel index
+        :return: Controller and its local pixel index
+        """
+
+        position = bisect_right(self.offsets, pixel) - 1
+        return self.controllers[position], pixel - self.offsets[position]
+
+    def setpixelcolor(self, pixel, color):
+        """
+        Sets a logical pixel to a new color
+        :param pixel: Logical pixel index
+        :param color: 24 bit color value
+        :return: None
+        """
+
+        if pixel < 0 or pixel >= self.length:
+            return
+
+        controller, local = self.locate(pixel)
+        controller.setpixelcolor(local, color)
+
+    def setgroupcolor(self, group, color):
+        """
+        Sets every pixel in a PixelGroup built on this group to a new color
+        :param group: PixelGroup
+        :param color: 24 bit color value
+        :return: None
+        """
+
+        for pixel in group.indexes:
+            self.setpixelcolor(pixel, color)
+
+    def runall(self, function):
+        """
+        Runs a function for every controller on the pool
+        :param function: Called with each controller
+        :return: List of results in controller order
+        """
+
+        return list(self.pool.map(function, self.controllers))
+
+    def begin(self, autodetect=False):
+        """
+        Starts every controller
+        :param autodetect: Passed to each controller's begin
+        :return: True if every controller started
+        """
+
+        return all(self.runall(lambda controller: controller.begin(autodetect=autodetect)))
+
+    def end(self):
+        """
+        Closes every port and stops the pool
+        :return: None
+        """
+
+        self.runall(lambda controller: controller.end())
+        self.pool.shutdown()
+
+    def enablefastmode(self, fast_mode=False):
+        """
+        Turns fast mode on or off on every controller
+        :param fast_mode: True to enable
+        :return: None
+        """
+
+        self.runall(lambda controller: controller.enablefastmode(fast_mode=fast_mode))
+
+    def enableframemode(self, frame_mode=False):
+        """
+        Turns frame mode on or off on every controller
+        :param frame_mode: True to enable
+        :return: None
+        """
+
+        self.runall(lambda controller: controller.enableframemode(frame_mode=frame_mode))
+
+    def enablereliablemode(self, reliable_mode=False):
+        """
+        Turns reliable fast mode on or off on every controller
+        :param reliable_mode: True to enable
+        :return: None
+        """
+
+        self.runall(lambda controller: controller.enablereliablemode(reliable_mode=reliable_mode))
+
+    def enablewindowedmode(self, window_size=1):
+        """
+        Sets the slow mode window on every controller
+        :param window_size: Commands in flight per controller
+        :return: None
+        """
+
+        self.runall(lambda controller: controller.enablewindowedmode(window_size=window_size))
+
+    def updatepixels(self):
+        """
+        Sends every port's changes concurrently, then shows them all at once, nothing is sent if no pixel changed
+        :return: None
+        """
+
+        # The writer thread would send on its own schedule and race the group on the port
+        for controller in self.controllers:
+            if controller.writer_thread is not None:
+                raise ValueError("Controllers in a group can't use background mode, %s has it on" % controller.port)
+
+        if all(controller.dirty_start >= controller.dirty_end for controller in self.controllers):
+            return
+
+        barrier = threading.Barrier(len(self.controllers), timeout=self.SHOW_TIMEOUT)
+
+        def update(controller):
+
+            try:
+                controller.updatepixels(barrier)
+
+            except Exception:
+
+                # Don't leave the other ports waiting
+                barrier.abort()
+                raise
+
+        self.runall(update)
@@ -0,0 +1,242 @@
+"""
+Effects as lazy frame pipelines, sources yield frames, operators transform them and play() sends them
+Frames are computed only as they are played, so endless effects run in constant memory
+"""
+
+import itertools
+from collections import namedtuple
+import RGB
+from scheduler import FrameScheduler
+from timeline import interpolate, linear
+
+# Frame of an effect, one color per pixel with None for pixels the frame leaves alone, shown for duration seconds
+Frame = namedtuple("Frame", ["colors", "duration"])
+
+
+def solid(length, color, duration=0.0):
+    """
+    One frame with every pixel the same color
+    :param length: Number of pixels
+    :param color: 24 bit color
+    :param duration: Seconds to show it
+    :return: Generator of frames
+    """
+
+    yield Frame([color] * length, duration)
+
+
+def hold(length, duration):
+    """
+    One frame that changes nothing, a pause
+    :param length: Number of pixels
+    :param duration: Seconds to pause
+    :return: Generator of frames
+    """
+
+    yield Frame([None] * length, duration)
+
+
+def fade(length, start_color, end_color, steps, duration=0.0, easing=linear):
+    """
+    Fades every pixel from one color to another
+    :param length: Number of pixels
+    :param start_color: 24 bit color of the first frame
+    :param end_color: 24 bit color of the last frame
+    :param steps: Number of frames, less than 1 sets the end color at once
+    :param duration: Seconds the whole fade takes
+    :param easing: Easing function from timeline
+    :return: Generator of frames
+    """
+
+    if steps < 1:
+        yield Frame([end_color] * length, duration)
+        return
+
+    step_time = duration / steps
+    count = 0
+    while count < steps:
+
+        progress = count / (steps - 1) if steps > 1 else 1.0
+        yield Frame([interpolate(start_color, end_color, easing(progress))] * length, step_time)
+        count += 1
+
+
+def chase(length, indexes, color, background=RGB.BLACK, step_time=0.1, bounce=False):
+    """
+    Moves a single lit pixel along some pixels, one pass
+    :param length: Number of pixels
+    :param indexes: Pixels to move along in order, the others are left alone
+    :param color: 24 bit color of the lit pixel
+    :param background: 24 bit color of the other pixels along the way
+    :param step_time: Seconds on each pixel
+    :param bounce: Come back along the pixels, stopping before the first so loops don't repeat it
+    :return: Generator of frames
+    """
+
+    indexes = list(indexes)
+    positions = list(range(len(indexes)))
+    if bounce:
+        positions += list(range(len(indexes) - 2, 0, -1))
+
+    for position in positions:
+
+        colors = [None] * length
+        for count, index in enumerate(indexes):
+            colors[index] = color if count == position else background
+
+        yield Frame(colors, step_time)
+
+
+def flash(length, on_color, off_color=RGB.BLACK, flashes=1, time_on=0.1, time_off=0.1):
+    """
+    Turns every pixel on and off
+    :param length: Number of pixels
+    :param on_color: 24 bit color while on
+    :param off_color: 24 bit color while off
+    :param flashes: Number of times to turn on and off
+    :param time_on: Seconds on
+    :param time_off: Seconds off
+    :return: Generator of frames
+    """
+
+    count = 0
+    while count < flashes:
+        yield Frame([on_color] * length, time_on)
+        yield Frame([off_color] * length, time_off)
+        count += 1
+
+
+def fromtimeline(timeline, length):
+    """
+    Plays a Timeline as an effect, one frame per timeline frame
+    :param timeline: Timeline
+    :param length: Number of pixels
+    :return: Generator of frames
+    """
+
+    timestamps = timeline.timestamps()
+    for count, timestamp in enumerate(timestamps):
+
+        # Later tracks win where groups overlap, pixels no track has reached yet are left alone
+        colors = [None] * length
+        for group, keyframes in timeline.tracks:
+
+            color = timeline.colorat(keyframes, timestamp)
+            if color is None:
+                continue
+
+            for index in group.getindexes():
+                colors[index] = color
+
+        next_timestamp = timestamps[count + 1] if count + 1 < len(timestamps) else timestamp
+        yield Frame(colors, next_timestamp - timestamp)
+
+
+def mapframes(frames, function):
+    """
+    Changes every color of every frame
+    :param frames: Iterable of frames
+    :param function: Called with a 24 bit color, returns the new color
+    :return: Generator of frames
+    """
+
+    for frame in frames:
+        yield Frame([None if color is None else function(color) for color in frame.colors], frame.duration)
+
+
+def blend(frames, others, amount=0.5):
+    """
+    Mixes two effects frame by frame, stops when either ends
+    :param frames: Iterable of frames, their durations are kept
+    :param others: Iterable of frames to mix in, where only one side sets a pixel that side wins
+    :param amount: 0.0 for only frames up to 1.0 for only others
+    :return: Generator of frames
+    """
+
+    for frame, other in zip(frames, others):
+
+        colors = []
+        for color, other_color in zip(frame.colors, other.colors):
+
+            if other_color is None:
+                colors.append(color)
+            elif color is None:
+                colors.append(other_color)
+            else:
+                colors.append(interpolate(color, other_color, amount))
+
+        yield Frame(colors, frame.duration)
+
+
+def mask(frames, group):
+    """
+    Limits frames to a group's pixels
+    :param frames: Iterable of frames
+    :param group: PixelGroup to keep
+    :return: Generator of frames
+    """
+
+    indexes = set(group.getindexes())
+    for frame in frames:
+        yield Frame([color if index in indexes else None for index, color in enumerate(frame.colors)],
+                    frame.duration)
+
+
+def take(frames, count):
+    """
+    Cuts an effect short
+    :param frames: Iterable of frames
+    :param count: Number of frames to keep
+    :return: Generator of frames
+    """
+
+    return itertools.islice(frames, count)
+
+
+def loop(source, times=None):
+    """
+    Repeats an effect
+    :param source: Called with no arguments for a new iterable of frames each time
+    :param times: Number of repeats, None for endless
+    :return: Generator of frames
+    """
+
+    count = 0
+    while times is None or count < times:
+
+        for frame in source():
+            yield frame
+
+        count += 1
+
+
+def concat(*sources):
+    """
+    Plays effects one after another
+    :param sources: Iterables of frames
+    :return: Generator of frames
+    """
+
+    return itertools.chain(*sources)
+
+
+def play(frames, controller, scheduler=None):
+    """
+    Sends each frame as it is computed and holds it for its duration
+    :param frames: Iterable of frames
+    :param controller: LightingController to play on
+    :param scheduler: FrameScheduler to play on, None to start a new one
+    :return: None
+    """
+
+    if scheduler is None:
+        scheduler = FrameScheduler()
+        scheduler.start()
+
+    for frame in frames:
+
+        indexes = [index for index, color in enumerate(frame.colors) if color is not None]
+        controller.setpixelcolors(indexes, [frame.colors[index] for index in indexes])
+        controller.updatepixels()
+        scheduler.countframe()
+        scheduler.sleep(frame.duration)
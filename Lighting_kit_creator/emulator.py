@@ -0,0 +1,640 @@
+"""
+Software emulator of the lighting kit firmware
+Run with: python emulator.py, then pass the printed port to LightingController or MillenniumFalcon
+"""
+
+import os
+import pty
+import random
+import select
+import threading
+import time
+import tty
+from array import array
+from binascii import crc_hqx
+
+
+# emulates the controller firmware and keeps a virtual strip
+class DeviceEmulator:
+
+    # Constants
+    MAXLEDS = 255
+    MAXLEDS_WIDE = 0xFFFF
+    BITS24 = 0xFFFFFF
+    BITS_PER_BYTE = 10
+
+    # Responses
+    COM_READY = b"READY\n"
+    COM_RECEIVED = b"COMMAND_RECEIVED\n"
+    COM_INVALID = b"COMMAND_INVALID\n"
+
+    # Binary commands, see LightingController.COM_FRAME, COM_PALETTE and COM_INDEXED
+    COM_FRAME = ord("#")
+    COM_PALETTE = ord("%")
+    COM_INDEXED = ord("@")
+    FRAME_HEADER_LENGTH = 3
+    PALETTE_SIZE = 64
+
+    # Wide frame command, see LightingController.COM_WIDE_FRAME
+    COM_WIDE_FRAME = ord("W")
+    WIDE_FRAME_SHOW = 0x01
+    RECEIVE_BUFFER = 512
+
+    # Reliable frame command, see LightingController.COM_RELIABLE_FRAME
+    COM_RELIABLE_FRAME = ord("R")
+    RELIABLE_SHOW = 0x01
+    CRC_INITIAL = 0xFFFF
+    SEQUENCE_MASK = 0xFF
+    ACK_INTERVAL = 8
+
+    # Longest fast mode line, "IIII:RRGGBB\n"
+    FAST_LINE_MAX = 12
+
+    # Polling interval while no host has the port open
+    IDLE_INTERVAL = 0.01
+
+    # Time a host should leave between closing and reopening the port
+    RESET_TIME = 0.1
+
+    def __init__(self, baudrate=115200, ack_latency=0.0, processing_time=0.0, boot_time=0.1,
+                 receive_buffer=RECEIVE_BUFFER, error_rate=0.0):
+        """
+        Constructor
+        :param baudrate: Simulated line speed, None for no wire time
+        :param ack_latency: Seconds before each response is sent
+        :param processing_time: Seconds the firmware spends on each command
+        :param boot_time: Seconds between the port opening and READY, like a board resetting
+        :param receive_buffer: Bytes the firmware can hold, larger binary packets are dropped
+        :param error_rate: Chance each received byte is corrupted, like a noisy line
+        """
+
+        self.baudrate = baudrate
+        self.ack_latency = ack_latency
+        self.processing_time = processing_time
+        self.boot_time = boot_time
+        self.receive_buffer = receive_buffer
+        self.error_rate = error_rate
+
+        # Binary command handlers by marker
+        self.binary_commands = {
+            bytes([self.COM_FRAME]): self.handleframe,
+            bytes([self.COM_PALETTE]): self.handlepalette,
+            bytes([self.COM_INDEXED]): self.handleindexed,
+            bytes([self.COM_WIDE_FRAME]): self.handlewideframe,
+            bytes([self.COM_RELIABLE_FRAME]): self.handlereliableframe,
+        }
+
+        # Pty state
+        self.master = None
+        self.port = None
+        self.thread = None
+        self.running = False
+
+        self.reset()
+
+    def reset(self):
+        """
+        Returns the firmware to its power on state
+        :return: None
+        """
+
+        self.length = 0
+        self.fast_mode = False
+        self.wide_mode = False
+        self.input_buffer = b""
+
+        # Reliable mode, the next sequence number expected, None until the first packet
+        self.sequence = None
+        self.unacknowledged = 0
+        self.resyncing = False
+
+        # Pixels set by commands, and what the strip shows
+        self.pixels = array("I", [0]) * self.MAXLEDS_WIDE
+        self.strip = array("I", [0]) * self.MAXLEDS_WIDE
+        self.palette = array("I", [0]) * self.PALETTE_SIZE
+
+        # Statistics
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.commands = 0
+        self.invalid_commands = 0
+        self.shows = 0
+        self.corrupted_bytes = 0
+        self.crc_errors = 0
+
+    def getstrip(self):
+        """
+        Gets the colors the virtual strip shows
+        :return: List of 24 bit colors
+        """
+
+        return list(self.strip[:self.length])
+
+    def receive(self, data):
+        """
+        Processes bytes from the host
+        :param data: Bytes received
+        :return: Response bytes and the number of commands processed
+        """
+
+        self.bytes_received += len(data)
+        self.input_buffer += data
+
+        responses = []
+        commands = 0
+        while True:
+
+            # After a bad packet everything up to the next reliable packet or EXIT is noise
+            if self.resyncing and self.input_buffer[:1] != bytes([self.COM_RELIABLE_FRAME]):
+
+                positions = [position for position in (self.input_buffer.find(bytes([self.COM_RELIABLE_FRAME])),
+                                                       self.input_buffer.find(b"EXIT\n")) if position >= 0]
+                self.input_buffer = self.input_buffer[min(positions):] if len(positions) > 0 else b""
+                if len(self.input_buffer) == 0:
+                    break
+
+                if self.input_buffer.startswith(b"EXIT\n"):
+                    self.resyncing = False
+
+            # Binary commands, only in fast mode
+            if self.fast_mode and self.input_buffer[:1] in self.binary_commands:
+
+                if len(self.input_buffer) < self.FRAME_HEADER_LENGTH:
+                    break
+
+                end = self.FRAME_HEADER_LENGTH + int.from_bytes(self.input_buffer[1:3], "big")
+                handler = self.binary_commands[self.input_buffer[:1]]
+
+                # A reliable packet can't be longer than the receive buffer, the length must be corrupt
+                if handler == self.handlereliableframe and end > self.receive_buffer:
+                    self.badpacket()
+                    continue
+
+                if len(self.input_buffer) < end:
+                    break
+
+                body = self.input_buffer[self.FRAME_HEADER_LENGTH:end]
+
+                if handler == self.handlereliableframe:
+
+                    if not self.checkpacket(self.input_buffer[:end]):
+                        self.badpacket()
+                        continue
+
+                    self.input_buffer = self.input_buffer[end:]
+                    responses.append(handler(body))
+                    commands += 1
+                    continue
+
+                self.input_buffer = self.input_buffer[end:]
+
+                # A packet that overflows the receive buffer is lost
+                if end > self.receive_buffer:
+                    self.invalid_commands += 1
+                else:
+                    handler(body)
+                commands += 1
+                continue
+
+            # Fast mode lines are short, anything longer is noise
+            if self.fast_mode and b"\n" not in self.input_buffer[:self.FAST_LINE_MAX]:
+
+                if len(self.input_buffer) < self.FAST_LINE_MAX:
+                    break
+
+                self.invalid_commands += 1
+                self.input_buffer = self.input_buffer[1:]
+                self.resyncing = self.sequence is not None
+                continue
+
+            if b"\n" not in self.input_buffer:
+                break
+
+            line, separator, self.input_buffer = self.input_buffer.partition(b"\n")
+            response = self.handleline(line.decode("utf8", "replace"))
+            commands += 1
+
+            if response is not None:
+                responses.append(response)
+
+        # Acknowledge what arrived once the line goes quiet
+        if self.unacknowledged > 0 and len(self.input_buffer) == 0:
+            responses.append(self.acknowledge())
+
+        self.commands += commands
+        return b"".join(responses), commands
+
+    def checkpacket(self, packet):
+        """
+        Checks a reliable packet's CRC
+        :param packet: Whole packet, marker to CRC
+        :return: True if the packet is intact
+        """
+
+        return crc_hqx(packet[3:-2], self.CRC_INITIAL) == int.from_bytes(packet[-2:], "big")
+
+    def badpacket(self):
+        """
+        Drops a packet that failed its check and looks for the next one
+        :return: None
+        """
+
+        self.crc_errors += 1
+        self.invalid_commands += 1
+        self.input_buffer = self.input_buffer[1:]
+        self.resyncing = True
+
+    def acknowledge(self):
+        """
+        Acknowledges every reliable packet up to the last one received
+        :return: Response bytes
+        """
+
+        self.unacknowledged = 0
+        return bytes("ACK:%02X\n" % ((self.sequence - 1) & self.SEQUENCE_MASK), encoding="utf8")
+
+    def corrupt(self, data):
+        """
+        Corrupts random bytes at error_rate
+        :param data: Bytes received
+        :return: Bytes as they arrived
+        """
+
+        if self.error_rate <= 0.0:
+            return data
+
+        data = bytearray(data)
+        position = int(random.expovariate(self.error_rate))
+        while position < len(data):
+
+            data[position] ^= random.randint(1, 0xFF)
+            self.corrupted_bytes += 1
+            position += 1 + int(random.expovariate(self.error_rate))
+
+        return bytes(data)
+
+    def handleline(self, line):
+        """
+        Processes one text command
+        :param line: Command without the newline
+        :return: Response bytes, None if the command has no response
+        """
+
+        if self.fast_mode:
+            return self.handlefast(line)
+
+        if not line.startswith("{") or not line.endswith("}"):
+            return self.invalid()
+
+        name, separator, parameters = line[1:-1].partition(":")
+        try:
+            values = [int(value, 16) for value in parameters.split(",") if value != ""]
+        except ValueError:
+            return self.invalid()
+
+        if name == "INIT" and len(values) == 2:
+            self.length = min(values[0], self.MAXLEDS)
+            self.wide_mode = False
+            self.fill(0, self.length, values[1])
+
+        elif name == "INIT_WIDE" and len(values) == 2:
+            self.length = min(values[0], self.MAXLEDS_WIDE)
+            self.wide_mode = True
+            self.fill(0, self.length, values[1])
+
+        elif name == "UPDATE" and len(values) == 0:
+            self.show()
+
+        elif name == "SET_ONE" and len(values) == 2:
+            self.fill(values[0], 1, values[1])
+
+        elif name == "SET_MANY" and len(values) == 3:
+            self.fill(values[0], values[2], values[1])
+
+        elif name == "ENTER_FAST" and len(values) == 0:
+            self.fast_mode = True
+            self.sequence = None
+
+        else:
+            return self.invalid()
+
+        return self.COM_RECEIVED
+
+    def handlefast(self, line):
+        """
+        Processes one fast mode line, only leaving fast mode is acknowledged
+        :param line: Command without the newline
+        :return: Response bytes, None if the command has no response
+        """
+
+        if line == "U":
+            self.show()
+            return None
+
+        if line == "EXIT":
+            self.fast_mode = False
+            self.resyncing = False
+            return self.COM_RECEIVED
+
+        # Wide strips take 4 index digits
+        index, separator, color = line.partition(":")
+        if len(index) != (4 if self.wide_mode else 2):
+            self.invalid_commands += 1
+            return None
+
+        try:
+            self.fill(int(index, 16), 1, int(color, 16))
+        except ValueError:
+            self.invalid_commands += 1
+
+        return None
+
+    def handleframe(self, body):
+        """
+        Processes a binary frame command and shows it
+        :param body: Start, count and packed colors
+        :return: None
+        """
+
+        start = body[0]
+        count = body[1]
+        position = 2
+        index = start
+        while index < start + count and index < self.length:
+
+            self.pixels[index] = int.from_bytes(body[position:position + 3], "big")
+            position += 3
+            index += 1
+
+        self.show()
+
+    def handlewideframe(self, body):
+        """
+        Processes a wide frame packet, shows it if it is the last of its frame
+        :param body: Flags, start and count (2 bytes each), then packed colors
+        :return: None
+        """
+
+        if not self.wide_mode:
+            self.invalid_commands += 1
+            return
+
+        flags = body[0]
+        start = int.from_bytes(body[1:3], "big")
+        count = int.from_bytes(body[3:5], "big")
+        position = 5
+        index = start
+        while index < start + count and index < self.length:
+
+            self.pixels[index] = int.from_bytes(body[position:position + 3], "big")
+            position += 3
+            index += 1
+
+        if flags & self.WIDE_FRAME_SHOW:
+            self.show()
+
+    def handlereliableframe(self, body):
+        """
+        Processes a reliable frame packet that passed its check, shows it if it is the last of its frame
+        :param body: Sequence, flags, start and count (2 bytes each), packed colors, then the CRC
+        :return: Response bytes, NAKs for packets that were skipped and an ACK now and then
+        """
+
+        self.resyncing = False
+        sequence = body[0]
+        flags = body[1]
+
+        # Packets more than half the sequence space behind are old
+        responses = b""
+        if self.sequence is not None:
+
+            skipped = (sequence - self.sequence) & self.SEQUENCE_MASK
+            if skipped > self.SEQUENCE_MASK // 2:
+                return responses
+
+            for count in range(skipped):
+                responses += bytes("NAK:%02X\n" % ((self.sequence + count) & self.SEQUENCE_MASK), encoding="utf8")
+
+        self.sequence = (sequence + 1) & self.SEQUENCE_MASK
+
+        start = int.from_bytes(body[2:4], "big")
+        count = int.from_bytes(body[4:6], "big")
+        position = 6
+        index = start
+        while index < start + count and index < self.length:
+
+            self.pixels[index] = int.from_bytes(body[position:position + 3], "big")
+            position += 3
+            index += 1
+
+        if flags & self.RELIABLE_SHOW:
+            self.show()
+
+        self.unacknowledged += 1
+        if self.unacknowledged >= self.ACK_INTERVAL:
+            responses += self.acknowledge()
+
+        return responses
+
+    def handlepalette(self, body):
+        """
+        Processes a palette upload
+        :param body: Count, then a slot and packed color per entry
+        :return: None
+        """
+
+        count = body[0]
+        position = 1
+        while count > 0:
+
+            slot = body[position]
+            if slot < self.PALETTE_SIZE:
+                self.palette[slot] = int.from_bytes(body[position + 1:position + 4], "big")
+            else:
+                self.invalid_commands += 1
+
+            position += 4
+            count -= 1
+
+    def handleindexed(self, body):
+        """
+        Processes an indexed frame, slots are looked up now so later uploads don't change these pixels, then shows it
+        :param body: Start, count and one palette slot per pixel
+        :return: None
+        """
+
+        start = body[0]
+        count = body[1]
+        position = 2
+        index = start
+        while index < start + count and index < self.length:
+
+            slot = body[position]
+            if slot < self.PALETTE_SIZE:
+                self.pixels[index] = self.palette[slot]
+            else:
+                self.invalid_commands += 1
+
+            position += 1
+            index += 1
+
+        self.show()
+
+    def fill(self, start, count, color):
+        """
+        Sets a run of pixels, pixels past the strip length are ignored like the firmware does
+        :param start: First pixel
+        :param count: Number of pixels
+        :param color: 24 bit color
+        :return: None
+        """
+
+        index = start
+        while index < start + count and index < self.length:
+            self.pixels[index] = color & self.BITS24
+            index += 1
+
+    def show(self):
+        """
+        Copies the set pixels to the virtual strip
+        :return: None
+        """
+
+        self.strip[:self.length] = self.pixels[:self.length]
+        self.shows += 1
+
+    def invalid(self):
+        """
+        Counts an invalid command
+        :return: Invalid response
+        """
+
+        self.invalid_commands += 1
+        return self.COM_INVALID
+
+    def wiretime(self, byte_count):
+        """
+        Gets the time bytes spend on the wire
+        :param byte_count: Number of bytes
+        :return: Seconds
+        """
+
+        if self.baudrate is None:
+            return 0.0
+
+        return byte_count * self.BITS_PER_BYTE / self.baudrate
+
+    def start(self):
+        """
+        Starts emulating on a new pseudo terminal, the host should wait RESET_TIME between closing and
+        reopening it or the emulator may not see the reset
+        :return: The port name to open
+        """
+
+        self.master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+
+        # The host's open is seen as the slave hanging up no longer
+        os.close(slave)
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        return self.port
+
+    def stop(self):
+        """
+        Stops emulating and closes the pseudo terminal
+        :return: None
+        """
+
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        if self.master is not None:
+            os.close(self.master)
+            self.master = None
+
+    def run(self):
+        """
+        Serves the pseudo terminal, resets whenever the host closes the port
+        :return: None
+        """
+
+        poller = select.poll()
+        poller.register(self.master, select.POLLIN)
+        connected = False
+
+        while self.running:
+
+            events = poller.poll(self.IDLE_INTERVAL * 1000)
+            hung_up = any(event & select.POLLHUP for fd, event in events)
+
+            # Host closed the port, the board resets
+            if hung_up:
+
+                if connected:
+                    connected = False
+                    self.reset()
+
+                time.sleep(self.IDLE_INTERVAL)
+                continue
+
+            # Host opened the port, boot and say hello
+            if not connected:
+                connected = True
+                time.sleep(self.boot_time)
+                self.send(self.COM_READY)
+                continue
+
+            if len(events) == 0:
+
+                # A packet still incomplete when the line goes quiet had a corrupt length
+                if self.input_buffer[:1] == bytes([self.COM_RELIABLE_FRAME]) and self.fast_mode:
+                    self.badpacket()
+                    responses, commands = self.receive(b"")
+                    if len(responses) > 0:
+                        self.send(responses)
+
+                continue
+
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                continue
+
+            time.sleep(self.wiretime(len(data)))
+            responses, commands = self.receive(self.corrupt(data))
+            time.sleep(self.processing_time * commands)
+
+            if len(responses) > 0:
+                time.sleep(self.ack_latency)
+                self.send(responses)
+
+    def send(self, data):
+        """
+        Sends bytes to the host
+        :param data: Bytes
+        :return: None
+        """
+
+        time.sleep(self.wiretime(len(data)))
+        os.write(self.master, data)
+        self.bytes_sent += len(data)
+
+
+if __name__ == "__main__":
+
+    emulator = DeviceEmulator()
+    print(emulator.start())
+
+    try:
+        while True:
+            time.sleep(1)
+
+    except KeyboardInterrupt:
+        emulator.stop()
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark of the frame encoder against the per pixel create_command_fast path
+Run with: python encoderBenchmark.py
+"""
+
+import timeit
+import lightingController as lc
+
+REPEAT = 5
+NUMBER = 2000
+
+
+def createcontroller(length):
+    """
+    Creates a controller with every pixel changed, the serial port is never opened
+    :param length: Number of pixels
+    :return: LightingController
+    """
+
+    con = lc.LightingController(length=length, color=lc.LightingController.BLACK)
+    count = 0
+    while count < length:
+        con.setpixelcolor(count, (count * 0x010305) & con.BITS24)
+        count += 1
+
+    return con
+
+
+def encodepercommand(con, changed):
+    """
+    Encodes a frame the way updatepixelsfast used to, one bytes object per pixel
+    :return: List of commands
+    """
+
+    commands = []
+    for count in changed:
+        commands.append(con.create_command_fast(count, con.pixel_buffer[count]))
+
+    commands.append(con.COM_UPDATE_FAST)
+    return commands
+
+
+def encodeframeencoder(con, changed):
+    """
+    Encodes a frame with the controller's frame encoder
+    :return: The encoded frame
+    """
+
+    return con.encoder.encodefast(con.pixel_buffer, changed)
+
+
+def runbenchmark(length):
+    """
+    Times both encoders for one strip length
+    :param length: Number of pixels
+    :return: None
+    """
+
+    con = createcontroller(length)
+    changed = con.changedpixels()
+
+    # Both paths must produce the same bytes on the wire
+    if b"".join(encodepercommand(con, changed)) != bytes(encodeframeencoder(con, changed)):
+        raise AssertionError("Frame encoder output differs from create_command_fast")
+
+    old = min(timeit.repeat(lambda: encodepercommand(con, changed), repeat=REPEAT, number=NUMBER))
+    new = min(timeit.repeat(lambda: encodeframeencoder(con, changed), repeat=REPEAT, number=NUMBER))
+
+    print("%4d pixels: create_command_fast %8.2f us/frame, FrameEncoder %8.2f us/frame, %5.1fx"
+          % (length, old / NUMBER * 1e6, new / NUMBER * 1e6, old / new))
+
+
+if __name__ == "__main__":
+
+    for strip_length in [21, 60, 144, 255]:
+        runbenchmark(strip_length)
@@ -1,6 +1,10 @@
+import compositor
+import effects
 import lightingController as lc
 import RGB
-import time
+import timeline
+from pixelGroup import PixelGroup
+from scheduler import FrameScheduler
 from datetime import datetime
 
 # Constants
@@ -25,77 +29,171 @@ LANDING_LIGHTS_ON = 0xFFFFFF
 # Laser light constants
 LASER_ON = 0xFF0000
 
-class Neopixel(RGB.Pixel):
+# Falcon class
+class MillenniumFalcon:
 
-    def __init__(self, index, color=RGB.BLACK):
+    def __init__(self, port):
         """
         Constructor
-        :param index: The index of the neopixel
+        :param port: The serial port string
         """
-        super(Neopixel, self).__init__(initial_color=color)
 
-        self.index = index
+        # Lighting controller
+        self.con = lc.LightingController(port=port, length=STRIP_LENGTH, color=RGB.BLACK)
+        self.con.begin()
+        self.con.enablefastmode(fast_mode=False)
+
+        # Create group of all neopixels
+        self.allpixels = PixelGroup(self.con, range(STRIP_LENGTH))
+
+        # Create engine group
+        self.engines = PixelGroup(self.con, self.createengineindexes())
+
+        # Create landing light group
+        self.landinglights = PixelGroup(self.con, LANDING_LIGHTS)
+
+        # Create laser group
+        self.lasers = PixelGroup(self.con, LASERS)
+
+        # Create front laser group
+        self.frontlasers = PixelGroup(self.con, FRONT_LASER)
+
+        # Create top laser group
+        self.toplasers = PixelGroup(self.con, TOP_LASER)
 
-    def setindex(self, index):
+        # Show clock, None times every sequence on its own
+        self.scheduler = None
+
+        # Create sequences
+        self.takingofftimeline = self.createtakingofftimeline()
+        self.landingtimeline = self.createlandingtimeline()
+        self.startupenginestimeline = self.createstartupenginestimeline()
+        self.restartenginestimeline = self.createrestartenginestimeline()
+        self.gotohyperspacetimeline = self.creategotohyperspacetimeline()
+        self.compilesequences()
+
+    def enablefastmode(self, fast_mode=False):
         """
-        Set the index of the pixel
-        :param index: index
+        Turns fast mode on or off
+        :param fast_mode: True to enable
         :return: None
         """
 
-        if index < 0:
-            return
+        self.con.enablefastmode(fast_mode=fast_mode)
+        self.compilesequences()
 
-        self.index = index
+    def enableframemode(self, frame_mode=False):
+        """
+        Turns frame mode on or off, frame mode sends each update as one binary command
+        :param frame_mode: True to enable
+        :return: None
+        """
+
+        self.con.enableframemode(frame_mode=frame_mode)
+        self.compilesequences()
 
-    def getindex(self):
+    def enablepalettemode(self, palette_mode=False):
         """
-        Get the index of the pixel
-        :return: index
+        Turns palette mode on or off, palette mode sends each pixel as a 1 byte palette slot
+        :param palette_mode: True to enable
+        :return: None
         """
 
-        return self.index
+        self.con.enablepalettemode(palette_mode=palette_mode)
+        self.compilesequences()
 
-# Falcon class
-class MillenniumFalcon:
+    def enablewindowedmode(self, window_size=1):
+        """
+        Sets how many slow mode commands may wait on a response at once
+        :param window_size: Commands in flight, 1 waits for every response
+        :return: None
+        """
 
-    def __init__(self, port):
+        self.con.enablewindowedmode(window_size=window_size)
+
+    def enablereliablemode(self, reliable_mode=False):
         """
-        Constructor
-        :param port: The serial port string
+        Turns reliable fast mode on or off, updates are checked by the device and lost pixels are sent again
+        :param reliable_mode: True to enable
+        :return: None
         """
 
-        # Lighting controller
-        self.con = lc.LightingController(port=port, length=STRIP_LENGTH, color=RGB.BLACK)
-        self.con.begin()
-        self.con.enablefastmode(fast_mode=False)
+        self.con.enablereliablemode(reliable_mode=reliable_mode)
+        self.compilesequences()
 
-        # Create neopixels
-        self.pixel_list = self.createlights()
+    def enablebackgroundmode(self, queue_size=0):
+        """
+        Sends updates from a writer thread so a stalled port drops frames instead of holding up the show
+        :param queue_size: Frames waiting to be sent, 1 keeps only the newest, 0 sends from the show's thread
+        :return: None
+        """
 
-        # Create engine indexes
-        self.enginelist = self.createengineindexes()
+        self.con.enablebackgroundmode(queue_size=queue_size)
 
-        # Create landing light indexes
-        self.landinglights = LANDING_LIGHTS
+    def setbrightness(self, brightness=RGB.BRIGHT_MAX, gamma=1.0):
+        """
+        Dims the whole show, applied as pixels are sent so the sequences keep their colors
+        :param brightness: Master level, RGB.BRIGHT_MAX for full strength
+        :param gamma: Gamma exponent, 1.0 is linear
+        :return: None
+        """
 
-        # Create laser indexes
-        self.lasers = LASERS
+        self.con.setcorrection(brightness=brightness, gamma=gamma)
 
-        # Create front laser indexes
-        self.frontlasers = FRONT_LASER
+    def compilesequences(self):
+        """
+        Compiles the sequences for the current mode so playback does no color math or encoding
+        :return: None
+        """
 
-        # Create top laser indexes
-        self.toplasers = TOP_LASER
+        for sequence in [self.takingofftimeline, self.landingtimeline, self.startupenginestimeline,
+                         self.restartenginestimeline, self.gotohyperspacetimeline]:
+            sequence.compile(self.con)
 
-    def enablefastmode(self, fast_mode=False):
+    def startshow(self, clock=None):
         """
-        Turns fast mode on or off
-        :param fast_mode: True to enable
+        Runs everything from here on against one clock, so time spent sending never adds up over a show
+        :param clock: VirtualClock to render the show without waiting, None for real time
         :return: None
         """
 
-        self.con.enablefastmode(fast_mode=fast_mode)
+        self.scheduler = FrameScheduler(clock=clock)
+        self.scheduler.start()
+
+    def endshow(self):
+        """
+        Stops the show clock
+        :return: Dictionary of scheduler statistics, None if no show was running
+        """
+
+        if self.scheduler is None:
+            return None
+
+        stats = self.scheduler.getstats()
+        self.scheduler = None
+        return stats
+
+    def getscheduler(self):
+        """
+        Gets the show's scheduler, or a new one started now outside of a show
+        :return: FrameScheduler
+        """
+
+        if self.scheduler is not None:
+            return self.scheduler
+
+        scheduler = FrameScheduler()
+        scheduler.start()
+        return scheduler
+
+    def wait(self, seconds):
+        """
+        Waits on the show clock, use instead of time.sleep between sequences
+        :param seconds: Time to wait
+        :return: None
+        """
+
+        self.getscheduler().sleep(seconds)
 
     def testalllighttypes(self):
         """
@@ -103,6 +201,8 @@ class MillenniumFalcon:
         :return: None
         """
 
+        scheduler = self.getscheduler()
+
         # Start in black
         self.setallcolor(RGB.BLACK)
         self.updatelights()
@@ -112,7 +212,7 @@ class MillenniumFalcon:
         self.updatelights()
 
         # Pause
-        time.sleep(5)
+        scheduler.sleep(5)
         self.setallcolor(RGB.BLACK)
         self.updatelights()
 
@@ -121,7 +221,7 @@ class MillenniumFalcon:
         self.updatelights()
 
         # Pause
-        time.sleep(5)
+        scheduler.sleep(5)
         self.setallcolor(RGB.BLACK)
         self.updatelights()
 
@@ -132,121 +232,78 @@ class MillenniumFalcon:
             self.setlasercolors(LASER_ON)
             self.updatelights()
 
-            time.sleep(0.05)
+            scheduler.sleep(0.05)
 
             self.setlasercolors(RGB.BLACK)
             self.updatelights()
 
-            time.sleep(0.1)
+            scheduler.sleep(0.1)
 
             count += 1
 
-        time.sleep(0.5)
+        scheduler.sleep(0.5)
 
         count = 0
         while count < 3:
             self.setlasercolors(0xFF0000)
             self.updatelights()
 
-            time.sleep(0.05)
+            scheduler.sleep(0.05)
 
             self.setlasercolors(RGB.BLACK)
             self.updatelights()
 
-            time.sleep(0.1)
+            scheduler.sleep(0.1)
 
             count += 1
 
-    def quickdisplay(self):
+    def createquickdisplayeffect(self):
         """
-        Runs a quick display of all lights
-        :return: None
+        Creates one cycle of the quick display
+        :return: Generator of frames
         """
-        while True:
-            # Turn everything off
-            self.setallcolor(RGB.BLACK)
-            self.updatelights()
-            time.sleep(5)
 
-            # Turn all on
-            self.setenginecolor(ENGINE_NORMAL)
-            self.setlandinglights(LANDING_LIGHTS_ON)
-            self.updatelights()
-            time.sleep(2)
-            self.fireeverything()
-            time.sleep(1)
-            self.fireeverything()
-            time.sleep(5)
+        return effects.concat(
+            effects.solid(STRIP_LENGTH, RGB.BLACK, 5),
+            effects.blend(effects.mask(effects.solid(STRIP_LENGTH, ENGINE_NORMAL, 2), self.engines),
+                          effects.mask(effects.solid(STRIP_LENGTH, LANDING_LIGHTS_ON), self.landinglights), 1.0),
+            self.createfireeverythingeffect(),
+            effects.hold(STRIP_LENGTH, 1),
+            self.createfireeverythingeffect(),
+            effects.hold(STRIP_LENGTH, 5))
 
-    def lighttest(self):
+    def quickdisplay(self, cycles=None):
         """
-        Runs a test of all the lights
-        :return: Does not return
+        Runs a quick display of all lights
+        :param cycles: Number of cycles, None to run forever
+        :return: None
         """
-        custom_time = 0.0000
-
-        while True:
-
-            # Go full red
-            main_count = 0
-            sleep_time = custom_time
-            while main_count <= 0xFF:
-
-                self.setallcolor(main_count << 16)
-
-                self.updatelights()
-                time.sleep(sleep_time)
-                main_count += 1
-
-            # Taper off red
-            main_count = 0xFF
-            sleep_time = custom_time
-            while main_count >= 0:
-                self.setallcolor(main_count << 16)
-
-                self.updatelights()
-                time.sleep(sleep_time)
-                main_count -= 1
 
-            # Go full green
-            main_count = 0
-            sleep_time = custom_time
-            while main_count <= 0xFF:
-                self.setallcolor(main_count << 8)
+        effects.play(effects.loop(self.createquickdisplayeffect, cycles), self.con, self.getscheduler())
 
-                self.updatelights()
-                time.sleep(sleep_time)
-                main_count += 1
-
-            # Taper off green
-            main_count = 0xFF
-            sleep_time = custom_time
-            while main_count >= 0:
-                self.setallcolor(main_count << 8)
+    def createlighttesteffect(self):
+        """
+        Creates one cycle of the light test, each channel fades up to full and back down
+        :return: Generator of frames
+        """
 
-                self.updatelights()
-                time.sleep(sleep_time)
-                main_count -= 1
+        ramps = []
+        for shift in (RGB.RED_SHIFT, RGB.GREEN_SHIFT, RGB.BLUE_SHIFT):
 
-            # Go full blue
-            main_count = 0
-            sleep_time = custom_time
-            while main_count <= 0xFF:
-                self.setallcolor(main_count)
+            full = RGB.COMPONENT_MAX << shift
+            ramps.append(effects.fade(STRIP_LENGTH, RGB.BLACK, full, RGB.COMPONENT_MAX + 1))
+            ramps.append(effects.fade(STRIP_LENGTH, full, RGB.BLACK, RGB.COMPONENT_MAX + 1))
 
-                self.updatelights()
-                time.sleep(sleep_time)
-                main_count += 1
+        return effects.concat(*ramps)
 
-            # Taper off blue
-            main_count = 0xFF
-            sleep_time = custom_time
-            while main_count >= 0:
-                self.setallcolor(main_count)
+    def lighttest(self, cycles=None):
+        """
+        Runs a test of all the lights
+        :param cycles: Number of cycles, None to run forever
+        :return: None
+        """
 
-                self.updatelights()
-                time.sleep(sleep_time)
-                main_count -= 1
+        effects.play(effects.loop(self.createlighttesteffect, cycles), self.con, self.getscheduler())
 
     def takingoff(self):
         """
@@ -254,58 +311,36 @@ class MillenniumFalcon:
         :return: None
         """
 
-        # Go full throttle
-        enginecolor = RGB.Pixel(initial_color=ENGINE_NORMAL)
-        main_count = 0
-        sleep_time = 0.025
-        while main_count < 0x20:
-            enginecolor.modifyred(1)
-            enginecolor.modifygreen(1)
-            self.setenginecolor(enginecolor.getcolor())
-
-            self.updatelights()
-            time.sleep(sleep_time)
-            main_count += 1
-
-        # Wait
-        time.sleep(1)
+        self.takingofftimeline.play(self.con, self.getscheduler())
 
-        # Dim out landing lights
-        landing_lights = RGB.Pixel(initial_color=LANDING_LIGHTS_ON)
-        main_count = 0
-        sleep_time = 0.005
-        while main_count < 0xFF:
-            landing_lights.modifyred(-1)
-            landing_lights.modifygreen(-1)
-            landing_lights.modifyblue(-1)
-            self.setlandinglights(landing_lights.getcolor())
-
-            self.updatelights()
-            time.sleep(sleep_time)
-            main_count += 1
+    def createtakingofftimeline(self):
+        """
+        Creates the taking off sequence
+        :return: Timeline
+        """
 
-        # Wait
-        time.sleep(5)
+        sequence = timeline.Timeline()
 
-        # Go to normal power ENGINE_FULL
-        enginecolor = RGB.Pixel(initial_color=ENGINE_FULL)
-        main_count = 0
-        sleep_time = 0.025
-        while main_count < 0x20:
-            enginecolor.modifyred(-1)
-            enginecolor.modifygreen(-1)
-            self.setenginecolor(enginecolor.getcolor())
+        # Go full throttle
+        throttle_time = 0x20 * 0.025
+        sequence.addkeyframe(self.engines, 0.0, ENGINE_NORMAL)
+        sequence.addkeyframe(self.engines, throttle_time, ENGINE_FULL)
 
-            self.updatelights()
-            time.sleep(sleep_time)
-            main_count += 1
+        # Wait, then dim out landing lights
+        dim_start = throttle_time + 1
+        dim_end = dim_start + 0xFF * 0.005
+        sequence.addkeyframe(self.landinglights, dim_start, LANDING_LIGHTS_ON)
+        sequence.addkeyframe(self.landinglights, dim_end, RGB.BLACK)
 
-        # Double check engine is normal
-        self.setenginecolor(ENGINE_NORMAL)
-        self.updatelights()
+        # Wait, then go to normal power
+        power_start = dim_end + 5
+        sequence.addkeyframe(self.engines, power_start, ENGINE_FULL)
+        sequence.addkeyframe(self.engines, power_start + throttle_time, ENGINE_NORMAL)
 
         # Wait
-        time.sleep(2)
+        sequence.duration = power_start + throttle_time + 2
+
+        return sequence
 
     def landing(self):
         """
@@ -313,89 +348,63 @@ class MillenniumFalcon:
         :return: None
         """
 
-        # Check engine normal
-        enginecolor = RGB.Pixel(initial_color=ENGINE_NORMAL)
-        self.setenginecolor(enginecolor.getcolor())
-        self.updatelights()
+        self.landingtimeline.play(self.con, self.getscheduler())
 
-        # Dim out landing lights
-        landing_lights = RGB.Pixel(initial_color=RGB.BLACK)
-        main_count = 0
-        sleep_time = 0.005
-        while main_count < 0xFF:
-            landing_lights.modifyred(1)
-            landing_lights.modifygreen(1)
-            landing_lights.modifyblue(1)
-            self.setlandinglights(landing_lights.getcolor())
-
-            self.updatelights()
-            time.sleep(sleep_time)
-            main_count += 1
+    def createlandingtimeline(self):
+        """
+        Creates the landing sequence
+        :return: Timeline
+        """
 
-        # Double check landing lights all the way on
-        self.setlandinglights(LANDING_LIGHTS_ON)
-        self.updatelights()
+        sequence = timeline.Timeline()
 
-        # Wait
-        time.sleep(5)
+        # Check engine normal
+        sequence.addkeyframe(self.engines, 0.0, ENGINE_NORMAL)
 
-        # Go to normal power ENGINE_FULL
-        enginecolor = RGB.Pixel(initial_color=ENGINE_NORMAL)
-        sleep_time = 0.025
-        while enginecolor.getblue() > 0:
-            enginecolor.modifyred(-1)
-            enginecolor.modifygreen(-1)
-            enginecolor.modifyblue(-1)
-            self.setenginecolor(enginecolor.getcolor())
+        # Bring up landing lights
+        light_time = 0xFF * 0.005
+        sequence.addkeyframe(self.landinglights, 0.0, RGB.BLACK)
+        sequence.addkeyframe(self.landinglights, light_time, LANDING_LIGHTS_ON)
 
-            self.updatelights()
-            time.sleep(sleep_time)
-
-        # Double check engine is normal
-        self.setenginecolor(RGB.BLACK)
-        self.updatelights()
+        # Wait, then power down the engine, red and green run out before blue
+        power_start = light_time + 5
+        sequence.addkeyframe(self.engines, power_start, ENGINE_NORMAL)
+        sequence.addkeyframe(self.engines, power_start + 0x20 * 0.025, 0x000020)
+        sequence.addkeyframe(self.engines, power_start + 0x40 * 0.025, RGB.BLACK)
 
         # Wait
-        time.sleep(2)
+        sequence.duration = power_start + 0x40 * 0.025 + 2
 
-    def fireeverything(self):
+        return sequence
+
+    def createlaservolley(self):
         """
-        Runs the fire everything simulation
-        :return: None
+        Creates one volley, the front lasers fire and then the top laser
+        :return: Generator of frames
         """
-        number_of_bursts = 0
 
-        while number_of_bursts < 3:
-            # Fire lasers
-            count = 0
-            while count < 3:
+        return effects.concat(
+            effects.mask(effects.flash(STRIP_LENGTH, LASER_ON, time_on=0.05, time_off=0.025), self.frontlasers),
+            effects.mask(effects.flash(STRIP_LENGTH, LASER_ON, time_on=0.05, time_off=0.025), self.toplasers))
 
-                # Fire front lasers
-                self.setfrontlasercolors(LASER_ON)
-                self.updatelights()
-
-                time.sleep(0.05)
-
-                self.setfrontlasercolors(RGB.BLACK)
-                self.updatelights()
-
-                time.sleep(0.025)
-
-                # Fire top laser
-                self.settoplasercolors(LASER_ON)
-                self.updatelights()
-
-                time.sleep(0.05)
+    def createfireeverythingeffect(self):
+        """
+        Creates the fire everything simulation, three bursts of three volleys
+        :return: Generator of frames
+        """
 
-                self.settoplasercolors(RGB.BLACK)
-                self.updatelights()
+        def burst():
+            return effects.concat(effects.loop(self.createlaservolley, 3), effects.hold(STRIP_LENGTH, 0.5))
 
-                time.sleep(0.025)
+        return effects.loop(burst, 3)
 
-                count += 1
+    def fireeverything(self):
+        """
+        Runs the fire everything simulation
+        :return: None
+        """
 
-            number_of_bursts += 1
-            time.sleep(0.5)
+        effects.play(self.createfireeverythingeffect(), self.con, self.getscheduler())
 
     def startupengines(self):
         """
@@ -403,24 +412,28 @@ class MillenniumFalcon:
         :return: None
         """
 
-        main_count = 0
-        sleep_time = 0.05
-        while main_count < 0x40:
+        self.startupenginestimeline.play(self.con, self.getscheduler())
 
-            self.setenginecolor(main_count)
+    def createstartupenginestimeline(self):
+        """
+        Creates the startup engines sequence
+        :return: Timeline
+        """
 
-            self.updatelights()
-            time.sleep(sleep_time)
-            main_count += 1
+        sequence = timeline.Timeline()
+        step_time = 0.05
 
-        main_count = 0
-        while main_count < 0x2020:
+        # Bring up blue
+        sequence.addkeyframe(self.engines, 0.0, RGB.BLACK)
+        sequence.addkeyframe(self.engines, 0x3F * step_time, 0x00003F)
 
-            self.setenginecolor((main_count << 8) + 0x40)
+        # Bring up red and green
+        sequence.addkeyframe(self.engines, 0x40 * step_time, 0x000040, easing=timeline.step)
+        sequence.addkeyframe(self.engines, (0x40 + 0x1F) * step_time, 0x1F1F40)
 
-            self.updatelights()
-            time.sleep(sleep_time)
-            main_count += 0x101
+        sequence.duration = (0x40 + 0x20) * step_time
+
+        return sequence
 
     def enginekill(self):
         """
@@ -438,29 +451,43 @@ class MillenniumFalcon:
         :return: None
         """
 
-        time_off = 0.25
-        while time_off > 0.0:
-            self.engineflash(ROUGH_START, number_flashes=1, time_off=time_off, time_on=0.30 - time_off)
-            time_off -= 0.05
+        self.restartenginestimeline.play(self.con, self.getscheduler())
 
-        sleep_time = 0.05
-        current_color = RGB.Pixel(initial_color=ROUGH_START)
-        while current_color.getcolor() != ENGINE_NORMAL:
+    def restartunderfire(self):
+        """
+        Runs the restart engines and fire everything simulations at the same time
+        :return: None
+        """
 
-            current_color.modifyred(-1)
-            current_color.modifygreen(-1)
-            current_color.modifyblue(2)
+        show = compositor.Compositor(self.con)
+        show.addlayer(effects.fromtimeline(self.restartenginestimeline, STRIP_LENGTH), group=self.engines)
+        show.addlayer(self.createfireeverythingeffect(), group=self.lasers)
+        show.run(self.getscheduler())
 
-            # Update the color
-            self.setenginecolor(current_color.getcolor())
+    def createrestartenginestimeline(self):
+        """
+        Creates the restart engines sequence
+        :return: Timeline
+        """
 
-            self.updatelights()
-            time.sleep(sleep_time)
+        sequence = timeline.Timeline()
 
-        # Make sure engine is normal
-        self.setenginecolor(ENGINE_NORMAL)
+        # Rough start, each flash stays off for less time
+        current_time = 0.0
+        time_off = 0.25
+        while time_off > 0.0:
 
-        self.updatelights()
+            sequence.addkeyframe(self.engines, current_time, RGB.BLACK, easing=timeline.step)
+            current_time += time_off
+            sequence.addkeyframe(self.engines, current_time, ROUGH_START, easing=timeline.step)
+            current_time += 0.30 - time_off
+            time_off -= 0.05
+
+        # Settle to normal
+        sequence.addkeyframe(self.engines, current_time, ROUGH_START)
+        sequence.addkeyframe(self.engines, current_time + 0x20 * 0.05, ENGINE_NORMAL)
+
+        return sequence
 
     def gotohyperspace(self):
         """
@@ -468,36 +495,25 @@ class MillenniumFalcon:
         :return: None
         """
 
-        # Go to hyperspace color
-        main_count = 0x20
-        current_color = RGB.Pixel(ENGINE_NORMAL)
-        sleep_time = 0.005
-        while main_count < 0xFF:
-
-            current_color.modifyred(1)
-            current_color.modifygreen(1)
-            self.setenginecolor(current_color.getcolor())
-            self.updatelights()
-            time.sleep(sleep_time)
-            main_count += 0x1
-
-        time.sleep(1)
+        self.gotohyperspacetimeline.play(self.con, self.getscheduler())
 
-        # Vanish into the distance
-        main_count = 0x40
-        current_color = RGB.Pixel(HYPERSPACE)
-        sleep_time = 0.01
-        while main_count >= 0:
+    def creategotohyperspacetimeline(self):
+        """
+        Creates the go to hyperspace sequence
+        :return: Timeline
+        """
 
-            self.setenginecolor(current_color.getcolor())
+        sequence = timeline.Timeline()
 
-            self.updatelights()
-            time.sleep(sleep_time)
-            main_count -= 0x1
+        # Go to hyperspace color
+        hyperspace_time = (0xFF - 0x20) * 0.005
+        sequence.addkeyframe(self.engines, 0.0, ENGINE_NORMAL)
+        sequence.addkeyframe(self.engines, hyperspace_time, HYPERSPACE)
 
-        self.setenginecolor(RGB.BLACK)
+        # Wait, then vanish into the distance
+        sequence.addkeyframe(self.engines, hyperspace_time + 1 + 0x41 * 0.01, RGB.BLACK, easing=timeline.step)
 
-        self.updatelights()
+        return sequence
 
     def losingpower(self):
         """
@@ -505,64 +521,52 @@ class MillenniumFalcon:
         :return: None
         """
 
-        self.engineflash(ENGINE_NORMAL)
+        scheduler = self.getscheduler()
+
+        self.engineflash(ENGINE_NORMAL, scheduler=scheduler)
         count = 0.25
         while count < 0.40:
-            self.engineflash(MID_DEATH, number_flashes=1, time_off=count, time_on=0.075)
+            self.engineflash(MID_DEATH, number_flashes=1, time_off=count, time_on=0.075, scheduler=scheduler)
             count += 0.05
 
         self.setenginecolor(RGB.BLACK)
         self.updatelights()
 
-    def canyouguess(self):
-
-        up = True
-        current_light = ENGINE_LOWER
-        while True:
-
-            # Set the new light
-            if up:
-
-                current_light += 1
-
-            else:
-
-                current_light -= 1
-
-            # Check bounds
-            if up and current_light == ENGINE_UPPER:
-
-                up = False
-
-            elif not up and current_light == ENGINE_LOWER:
-
-                up = True
-
-            # Update colors
-            count = ENGINE_LOWER
-            while count <= ENGINE_UPPER:
-
-                if count == current_light:
-                    self.con.setpixelcolor(count, RGB.RED)
+    def createcanyouguesseffect(self):
+        """
+        Creates one pass of a red light bouncing along the engines
+        :return: Generator of frames
+        """
 
-                else:
-                    self.con.setpixelcolor(count, RGB.BLACK)
+        return effects.chase(STRIP_LENGTH, range(ENGINE_LOWER, ENGINE_UPPER + 1), RGB.RED, step_time=0.1,
+                             bounce=True)
 
-                count += 1
+    def canyouguess(self, frames=None):
+        """
+        Bounces a red light along the engines
+        :param frames: Number of frames to run, None to run forever
+        :return: None
+        """
 
-            self.con.updatepixels()
+        effect = effects.loop(self.createcanyouguesseffect)
+        if frames is not None:
+            effect = effects.take(effect, frames)
 
-            time.sleep(0.1)
+        effects.play(effect, self.con, self.getscheduler())
 
-    def engineflash(self, on_color, number_flashes=2, time_off=0.1, time_on=0.1):
+    def engineflash(self, on_color, number_flashes=2, time_off=0.1, time_on=0.1, scheduler=None):
         """
         Flashes the engines
         :param number_flashes: Number of times the engines turn off and then back on
         :param time_off: Time the engine is off
         :param time_on: Time the ending is on between flashes
+        :param scheduler: FrameScheduler to time the flashes on, None for the show's
         :return: None
         """
 
+        if scheduler is None:
+            scheduler = self.getscheduler()
+
         starting_color = on_color
         main_count = 0
         while main_count < number_flashes:
@@ -571,30 +575,15 @@ class MillenniumFalcon:
             self.setenginecolor(RGB.BLACK)
 
             self.updatelights()
-            time.sleep(time_off)
+            scheduler.sleep(time_off)
 
             # Turn engine on
             self.setenginecolor(starting_color)
 
             self.updatelights()
-            time.sleep(time_on)
+            scheduler.sleep(time_on)
             main_count += 1
 
-    def createlights(self):
-        """
-        Create the list of neopixels for the falcon
-        :return: List of Neopixel objects
-        """
-
-        new_list = []
-        count = 0
-        while count < STRIP_LENGTH:
-
-            new_list.append(Neopixel(count, color=RGB.BLACK))
-            count += 1
-
-        return new_list
-
     def createengineindexes(self):
         """
         Creates a list of indexes for engine pixels
@@ -616,11 +605,7 @@ class MillenniumFalcon:
         :return: None
         """
 
-        for p in self.pixel_list:
-
-            if p.getindex() in self.enginelist:
-
-                p.setcolor(color)
+        self.engines.setcolor(color)
 
     def setlandinglights(self, color):
         """
@@ -629,11 +614,7 @@ class MillenniumFalcon:
         :return: None
         """
 
-        for p in self.pixel_list:
-
-            if p.getindex() in self.landinglights:
-
-                p.setcolor(color)
+        self.landinglights.setcolor(color)
 
     def setlasercolors(self, color):
         """
@@ -642,11 +623,7 @@ class MillenniumFalcon:
         :return: None
         """
 
-        for p in self.pixel_list:
-
-            if p.getindex() in self.lasers:
-
-                p.setcolor(color)
+        self.lasers.setcolor(color)
 
     def setfrontlasercolors(self, color):
         """
@@ -655,11 +632,7 @@ class MillenniumFalcon:
         :return: None
         """
 
-        for p in self.pixel_list:
-
-            if p.getindex() in self.frontlasers:
-
-                p.setcolor(color)
+        self.frontlasers.setcolor(color)
 
     def settoplasercolors(self, color):
         """
@@ -668,11 +641,7 @@ class MillenniumFalcon:
         :return: None
         """
 
-        for p in self.pixel_list:
-
-            if p.getindex() in self.toplasers:
-
-                p.setcolor(color)
+        self.toplasers.setcolor(color)
 
     def setallcolor(self, color):
         """
@@ -681,9 +650,7 @@ class MillenniumFalcon:
         :return: None
         """
 
-        for p in self.pixel_list:
-
-            p.setcolor(color)
+        self.allpixels.setcolor(color)
 
     def updatelights(self):
         """
@@ -691,7 +658,8 @@ class MillenniumFalcon:
         :return: None
         """
 
-        for p in self.pixel_list:
-            self.con.setpixelcolor(p.getindex(), p.getcolor())
-
         self.con.updatepixels()
+
+        # Counted toward the show's frame rate
+        if self.scheduler is not None:
+            self.scheduler.countframe()
@@ -0,0 +1,308 @@
+import struct
+from binascii import crc_hqx
+
+
+# Two uppercase hex digits for every byte value
+HEX_DIGITS = [bytes("%02X" % value, encoding="utf8") for value in range(256)]
+
+# Fast mode index digits with their separator
+HEX_INDEXES = [digits + b":" for digits in HEX_DIGITS]
+
+
+# encoder that builds whole frames in reusable buffers
+class FrameEncoder:
+
+    # Constants
+    BITS8 = 0xFF
+
+    # Fast mode line layout "II:RRGGBB\n", the newline is never patched
+    FAST_LINE = b"00:000000\n"
+    FAST_LINE_LENGTH = 10
+    FAST_DIGITS = struct.Struct("3s2s2s2s")
+
+    # Wide fast mode line layout "IIII:RRGGBB\n"
+    WIDE_LINE = b"0000:000000\n"
+    WIDE_LINE_LENGTH = 12
+    WIDE_DIGITS = struct.Struct("5s2s2s2s")
+
+    # Slow mode command layout "{SET_ONE:IIIIII,RRGGBB,}\n", indexes fill the low 4 digits
+    SLOW_COMMAND = b"{SET_ONE:000000,000000,}\n"
+    SLOW_INDEX = 11
+    SLOW_COLOR = 16
+    SLOW_DIGITS = struct.Struct("2s2s")
+    COLOR_DIGITS = struct.Struct("2s2s2s")
+
+    # Slow mode run command layout "{SET_MANY:SSSSSS,RRGGBB,NNNNNN,}\n", same parameter format as SET_ONE
+    MANY_COMMAND = b"{SET_MANY:000000,000000,000000,}\n"
+    MANY_START = 12
+    MANY_COLOR = 17
+    MANY_COUNT = 26
+
+    # Frame command header, see LightingController.COM_FRAME
+    FRAME_HEADER = struct.Struct(">BHBB")
+    FRAME_MARKER = ord("#")
+
+    # Wide frame command header, see LightingController.COM_WIDE_FRAME
+    WIDE_FRAME_HEADER = struct.Struct(">BHBHH")
+    WIDE_FRAME_MARKER = ord("W")
+    WIDE_FRAME_SHOW = 0x01
+
+    # Reliable frame command, see LightingController.COM_RELIABLE_FRAME, the CRC follows the colors
+    RELIABLE_HEADER = struct.Struct(">BHBBHH")
+    RELIABLE_CRC = struct.Struct(">H")
+    RELIABLE_MARKER = ord("R")
+    RELIABLE_SHOW = 0x01
+    CRC_INITIAL = 0xFFFF
+    SEQUENCE_MASK = 0xFF
+
+    # Palette commands, see LightingController.COM_PALETTE and COM_INDEXED
+    PALETTE_HEADER = struct.Struct(">BHB")
+    PALETTE_ENTRY = struct.Struct(">BBBB")
+    PALETTE_MARKER = ord("%")
+    INDEXED_MARKER = ord("@")
+
+    def __init__(self, max_pixels, show_command=b"U\n", wide=False, chunk_size=None):
+
+        self.max_pixels = max_pixels
+        self.show_command = show_command
+
+        # Wide addressing, 16 bit indexes, frames of either kind are split into packets of at most chunk_size bytes
+        self.wide = wide
+        if wide:
+            self.line = self.WIDE_LINE
+            self.line_length = self.WIDE_LINE_LENGTH
+            self.line_digits = self.WIDE_DIGITS
+            self.indexes = [bytes("%04X:" % index, encoding="utf8") for index in range(max_pixels)]
+            self.chunk_pixels = max(1, (chunk_size - self.WIDE_FRAME_HEADER.size) // 3) if chunk_size else max_pixels
+            frame_size = self.WIDE_FRAME_HEADER.size * self.countchunks(max_pixels) + 3 * max_pixels
+        else:
+            self.line = self.FAST_LINE
+            self.line_length = self.FAST_LINE_LENGTH
+            self.line_digits = self.FAST_DIGITS
+            self.indexes = HEX_INDEXES
+            self.chunk_pixels = max(1, (chunk_size - self.FRAME_HEADER.size) // 3) if chunk_size else max_pixels
+            frame_size = self.FRAME_HEADER.size * self.countchunks(max_pixels) + 3 * max_pixels
+
+        # Fast mode buffer, every line slot is prefilled so only digits are patched
+        self.fast_template = self.line * max_pixels + show_command
+        self.fast_buffer = bytearray(self.fast_template)
+        self.fast_view = memoryview(self.fast_buffer)
+        self.show_position = None
+
+        # Frame command buffer
+        self.frame_buffer = bytearray(frame_size)
+        self.frame_view = memoryview(self.frame_buffer)
+
+        # Reliable frame command buffer, packets are split like wide frames
+        overhead = self.RELIABLE_HEADER.size + self.RELIABLE_CRC.size
+        self.reliable_pixels = max(1, (chunk_size - overhead) // 3) if chunk_size else max_pixels
+        reliable_chunks = max(1, -(-max_pixels // self.reliable_pixels))
+        self.reliable_buffer = bytearray(overhead * reliable_chunks + 3 * max_pixels)
+        self.reliable_view = memoryview(self.reliable_buffer)
+
+        # Indexed frame command buffer
+        self.indexed_buffer = bytearray(self.FRAME_HEADER.size + max_pixels)
+        self.indexed_view = memoryview(self.indexed_buffer)
+
+        # Slow command buffers
+        self.slow_buffer = bytearray(self.SLOW_COMMAND)
+        self.many_buffer = bytearray(self.MANY_COMMAND)
+
+    # Encodes fast mode lines for the given pixels, followed by the show command if show is set
+    def encodefast(self, colors, indexes, show=True):
+
+        buffer = self.fast_buffer
+        pack_into = self.line_digits.pack_into
+        line_length = self.line_length
+        hex_indexes = self.indexes
+
+        # Restore the line slots the last show command overwrote
+        if self.show_position is not None:
+            end = self.show_position + len(self.show_command)
+            buffer[self.show_position:end] = self.fast_template[self.show_position:end]
+
+        position = 0
+        for index in indexes:
+
+            color = colors[index]
+            pack_into(buffer, position, hex_indexes[index], HEX_DIGITS[color >> 16],
+                      HEX_DIGITS[(color >> 8) & 0xFF], HEX_DIGITS[color & 0xFF])
+            position += line_length
+
+        if not show:
+            self.show_position = None
+            return self.fast_view[:position]
+
+        # Append the show command after the last line
+        end = position + len(self.show_command)
+        buffer[position:end] = self.show_command
+        self.show_position = position
+
+        return self.fast_view[:end]
+
+    # Gets the number of frame packets needed for count pixels, an empty frame still takes one
+    def countchunks(self, count):
+
+        return max(1, -(-count // self.chunk_pixels))
+
+    # Encodes frame commands for the pixels from start up to end, split into packets that fit the receive buffer
+    # Frame commands have no show flag, each packet shows as it arrives
+    def encodeframe(self, colors, start, end):
+
+        if self.wide:
+            return self.encodewideframe(colors, start, end)
+
+        buffer = self.frame_buffer
+        pack_header = self.FRAME_HEADER.pack_into
+        header_size = self.FRAME_HEADER.size
+
+        position = 0
+        chunk_start = start
+        while True:
+
+            chunk_end = min(chunk_start + self.chunk_pixels, end)
+            count = chunk_end - chunk_start
+            pack_header(buffer, position, self.FRAME_MARKER, 2 + 3 * count, chunk_start, count)
+            position += header_size
+
+            index = chunk_start
+            while index < chunk_end:
+
+                color = colors[index]
+                buffer[position] = color >> 16
+                buffer[position + 1] = (color >> 8) & 0xFF
+                buffer[position + 2] = color & 0xFF
+                position += 3
+                index += 1
+
+            if chunk_end == end:
+                return self.frame_view[:position]
+
+            chunk_start = chunk_end
+
+    # Encodes wide frame packets for the pixels from start up to end, only the last one shows
+    def encodewideframe(self, colors, start, end):
+
+        buffer = self.frame_buffer
+        pack_header = self.WIDE_FRAME_HEADER.pack_into
+        header_size = self.WIDE_FRAME_HEADER.size
+
+        position = 0
+        chunk_start = start
+        while True:
+
+            chunk_end = min(chunk_start + self.chunk_pixels, end)
+            count = chunk_end - chunk_start
+            flags = self.WIDE_FRAME_SHOW if chunk_end == end else 0
+            pack_header(buffer, position, self.WIDE_FRAME_MARKER, 5 + 3 * count, flags, chunk_start, count)
+            position += header_size
+
+            index = chunk_start
+            while index < chunk_end:
+
+                color = colors[index]
+                buffer[position] = color >> 16
+                buffer[position + 1] = (color >> 8) & 0xFF
+                buffer[position + 2] = color & 0xFF
+                position += 3
+                index += 1
+
+            if chunk_end == end:
+                return self.frame_view[:position]
+
+            chunk_start = chunk_end
+
+    # Encodes reliable frame packets for the pixels from start up to end, numbered from sequence
+    # Returns the packets and (sequence, start, end) of each, only the last packet shows
+    def encodereliable(self, colors, start, end, sequence):
+
+        buffer = self.reliable_buffer
+        view = self.reliable_view
+        pack_header = self.RELIABLE_HEADER.pack_into
+        pack_crc = self.RELIABLE_CRC.pack_into
+        header_size = self.RELIABLE_HEADER.size
+
+        packets = []
+        position = 0
+        chunk_start = start
+        while True:
+
+            chunk_end = min(chunk_start + self.reliable_pixels, end)
+            count = chunk_end - chunk_start
+            flags = self.RELIABLE_SHOW if chunk_end == end else 0
+            packet_start = position
+            pack_header(buffer, position, self.RELIABLE_MARKER, 8 + 3 * count, sequence, flags, chunk_start, count)
+            position += header_size
+
+            index = chunk_start
+            while index < chunk_end:
+
+                color = colors[index]
+                buffer[position] = color >> 16
+                buffer[position + 1] = (color >> 8) & 0xFF
+                buffer[position + 2] = color & 0xFF
+                position += 3
+                index += 1
+
+            # The CRC covers everything after the body length
+            pack_crc(buffer, position, crc_hqx(view[packet_start + 3:position], self.CRC_INITIAL))
+            position += self.RELIABLE_CRC.size
+
+            packets.append((sequence, chunk_start, chunk_end))
+            sequence = (sequence + 1) & self.SEQUENCE_MASK
+
+            if chunk_end == end:
+                return view[:position], packets
+
+            chunk_start = chunk_end
+
+    # Encodes a slow mode set command for one pixel
+    def encodeslow(self, index, color):
+
+        buffer = self.slow_buffer
+        self.SLOW_DIGITS.pack_into(buffer, self.SLOW_INDEX, HEX_DIGITS[(index >> 8) & self.BITS8],
+                                   HEX_DIGITS[index & self.BITS8])
+        self.COLOR_DIGITS.pack_into(buffer, self.SLOW_COLOR, HEX_DIGITS[color >> 16],
+                                    HEX_DIGITS[(color >> 8) & 0xFF], HEX_DIGITS[color & 0xFF])
+
+        # Slow commands are held until acknowledged so they need their own copy
+        return bytes(buffer)
+
+    # Encodes a slow mode command setting a run of pixels to one color
+    def encodemany(self, start, color, count):
+
+        buffer = self.many_buffer
+        self.SLOW_DIGITS.pack_into(buffer, self.MANY_START, HEX_DIGITS[(start >> 8) & self.BITS8],
+                                   HEX_DIGITS[start & self.BITS8])
+        self.COLOR_DIGITS.pack_into(buffer, self.MANY_COLOR, HEX_DIGITS[color >> 16],
+                                    HEX_DIGITS[(color >> 8) & 0xFF], HEX_DIGITS[color & 0xFF])
+        self.SLOW_DIGITS.pack_into(buffer, self.MANY_COUNT, HEX_DIGITS[(count >> 8) & self.BITS8],
+                                   HEX_DIGITS[count & self.BITS8])
+
+        return bytes(buffer)
+
+    # Encodes a palette upload for (slot, color) entries
+    def encodepalette(self, entries):
+
+        buffer = bytearray(self.PALETTE_HEADER.size + self.PALETTE_ENTRY.size * len(entries))
+        self.PALETTE_HEADER.pack_into(buffer, 0, self.PALETTE_MARKER, 1 + self.PALETTE_ENTRY.size * len(entries),
+                                      len(entries))
+
+        position = self.PALETTE_HEADER.size
+        for slot, color in entries:
+            self.PALETTE_ENTRY.pack_into(buffer, position, slot, color >> 16, (color >> 8) & 0xFF, color & 0xFF)
+            position += self.PALETTE_ENTRY.size
+
+        return buffer
+
+    # Encodes an indexed frame command for the pixels from start up to end, slots maps colors to palette slots
+    def encodeindexed(self, colors, start, end, slots):
+
+        count = end - start
+        buffer = self.indexed_buffer
+        self.FRAME_HEADER.pack_into(buffer, 0, self.INDEXED_MARKER, 2 + count, start, count)
+
+        position = self.FRAME_HEADER.size
+        buffer[position:position + count] = bytes([slots[color] for color in colors[start:end]])
+
+        return self.indexed_view[:position + count]
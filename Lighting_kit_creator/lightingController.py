@@ -1,4 +1,24 @@
+import glob
+import json
+import os
 import serial
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from serial.tools import list_ports
+from frameEncoder import FrameEncoder
+from metrics import ControllerMetrics, MeteredSerial
+from palette import ColorPalette
+from RGB import ColorCorrection
+from updatePlanner import UpdatePlanner
+
+# NumPy is optional, buffers fall back to array
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 # controller class to manage the neopixels
@@ -25,13 +45,91 @@ class LightingController:
     COM_ENTER_FAST = b'{ENTER_FAST}\n'
     COM_EXIT_FAST = b'EXIT\n'
     COM_SET_ONE = "SET_ONE"
-
-    def __init__(self, port=None, length=None, color=None):
+    COM_READY = b"READY\n"
+
+    # Frame command, only understood in fast mode
+    # Packet: '#', body length (2 bytes, big endian), start index (1 byte),
+    # count (1 byte), then count packed RRGGBB colors. Shows on receipt.
+    # Frames larger than the device's receive buffer go as several packets.
+    COM_FRAME = b'#'
+    FRAME_HEADER = ">BHBB"
+
+    # Palette commands, only understood in fast mode, colors are looked up on receipt
+    # Upload: '%', body length (2 bytes), count (1 byte), then count of slot (1 byte) and packed RRGGBB
+    # Indexed frame: '@', body length (2 bytes), start, count, then count slots (1 byte each). Shows on receipt.
+    COM_PALETTE = b'%'
+    COM_INDEXED = b'@'
+    PALETTE_SIZE = 64
+
+    # Wide addressing, for strips longer than MAXLEDS, chosen by sending {INIT_WIDE:LLLL,RRGGBB} instead of INIT
+    # Fast lines become "IIII:RRGGBB\n" and frames go as wide packets, palette commands aren't used
+    # Packet: 'W', body length (2 bytes), flags (1 byte, WIDE_FRAME_SHOW shows), start (2 bytes),
+    # count (2 bytes), then count packed RRGGBB colors. Packets fit the device's receive buffer,
+    # only the last packet of a frame shows.
+    MAXLEDS_WIDE = 0xFFFF
+    COM_INIT_WIDE = "INIT_WIDE"
+    COM_WIDE_FRAME = b'W'
+    WIDE_FRAME_HEADER = ">BHBHH"
+    WIDE_FRAME_SHOW = 0x01
+    RECEIVE_BUFFER = 512
+
+    # Reliable fast mode, every update goes as numbered packets the device checks and acknowledges
+    # Packet: 'R', body length (2 bytes), sequence (1 byte), flags (1 byte, RELIABLE_SHOW shows), start (2 bytes),
+    # count (2 bytes), count packed RRGGBB colors, then a CRC-16/CCITT of everything after the body length.
+    # The device drops packets that fail the CRC and answers "ACK:SS\n" for every packet up to SS now and then,
+    # or "NAK:SS\n" when it sees SS was skipped. The reader thread sends the pixels of a lost packet again.
+    COM_RELIABLE_FRAME = b'R'
+    COM_ACK = b'ACK:'
+    COM_NAK = b'NAK:'
+    RELIABLE_SHOW = 0x01
+    RELIABLE_WINDOW = 64
+    ACK_TIMEOUT = 0.5
+    FLUSH_TIMEOUT = 2.0
+
+    # Windowed slow mode constants
+    READER_TIMEOUT = 0.1
+    RESPONSE_TIMEOUT = 2.0
+
+    # Background mode constants
+    WRITER_TIMEOUT = 0.1
+
+    # Record buffer value no color can match, forces a pixel to be resent
+    UNSENT = 0xFFFFFFFF
+
+    # Autodetection constants
+    PORT_PATTERNS = ["/dev/ttyUSB*", "/dev/ttyACM*", "/dev/serial/by-id/*"]
+    PORT_CACHE = os.path.join(os.path.expanduser("~"), ".lighting_kit_port.json")
+    PROBE_INTERVAL = 0.1
+
+    # Opening the port resets the board, it sends READY once it has booted
+    # A port that hasn't answered PROBE_TIMEOUT after that isn't a controller
+    BOOT_TIME = 2.0
+    PROBE_TIMEOUT = 0.3
+
+    def __init__(self, port=None, length=None, color=None, use_numpy=False):
+
+        # Pixels the buffers hold, more than MAXLEDS only for wide strips
+        self.capacity = self.MAXLEDS
+        self.wide_mode = False
+        self.receive_buffer = self.RECEIVE_BUFFER
 
         # Create pixel buffer
+        self.use_numpy = use_numpy and numpy is not None
         self.pixel_buffer = self.createpixelbuffer()
         self.record_buffer = self.createpixelbuffer()
 
+        # Colors as sent, brightness and gamma applied, only used while a correction is set
+        self.output_buffer = self.createpixelbuffer()
+        self.correction = None
+
+        # Colors reliable mode sent last, lost packets are sent again from here
+        self.reliable_colors = self.createpixelbuffer()
+        self.group_corrections = []
+        self.correcting = False
+
+        # Create frame encoder
+        self.createencoder()
+
         # Create serial port
         self.ser = serial.Serial(baudrate=self.BAUDRATE)
 
@@ -52,25 +150,205 @@ class LightingController:
 
         # Set initial mode
         self.fast_mode = False
-
+        self.frame_mode = False
+
+        # Palette mode, the palette mirrors the device's slots
+        self.palette_mode = False
+        self.palette = ColorPalette(self.PALETTE_SIZE)
+
+        # Windowed slow mode, commands waiting on a response in send order
+        self.window_size = 1
+        self.pending_commands = deque()
+        self.invalid_commands = []
+        self.flushed_invalid_commands = []
+        self.window_condition = threading.Condition()
+        self.reader_thread = None
+        self.reader_timeout = None
+        self.reader_error = None
+
+        # Reliable fast mode, packets not yet acknowledged as (sequence, start, end, time sent)
+        # and pixel ranges the device lost, filled by the reader thread
+        # The reliable lock keeps packets written by updates and by the reader in sequence order
+        self.reliable_mode = False
+        self.reliable_lock = threading.Lock()
+        self.sequence = 0
+        self.unacknowledged = deque()
+        self.lost_ranges = []
+        self.lost_everything = False
+        self.reliable_stats = {"packets": 0, "acks": 0, "naks": 0, "timeouts": 0, "keyframes": 0,
+                               "resent_pixels": 0}
+
+        # Hot path metrics, None while disabled
+        self.metrics = None
+
+        # ShowRecorder capturing every update, None while not recording
+        self.recorder = None
+
+        # Pixels written since the last update, everything outside matches the record buffer
+        self.dirty_start = self.capacity
+        self.dirty_end = 0
+
+        # Background mode, snapshots waiting for the writer thread oldest first
+        # The writer owns the record buffer and the port while it runs
+        self.queue_size = 0
+        self.queued_frames = deque()
+        self.writing = False
+        self.writer_condition = threading.Condition()
+        self.writer_thread = None
+        self.writer_stats = {"queued": 0, "sent": 0, "dropped": 0, "coalesced": 0}
+
+    # Copies the dirty range to the record buffer and marks everything clean
     def copytorecordbuffer(self):
 
-        count = 0
-        while count < len(self.pixel_buffer):
-            self.record_buffer[count] = self.pixel_buffer[count]
-            count += 1
+        start = self.dirty_start
+        end = self.dirty_end
+        if start < end:
+            self.record_buffer[start:end] = self.pixel_buffer[start:end]
+
+        self.dirty_start = self.capacity
+        self.dirty_end = 0
+
+    # Widens the dirty range to cover pixels from start up to end
+    def markdirty(self, start, end):
+
+        if start < self.dirty_start:
+            self.dirty_start = start
+
+        if end > self.dirty_end:
+            self.dirty_end = end
+
+    # Forgets what the strip shows, the next update resends every pixel or only a group's pixels
+    def forceresend(self, group=None):
+
+        # The writer thread compares against the record buffer
+        with self.writer_condition:
+            self.forgetsentpixels(group)
+
+    # Marks pixels as unsent, the writer lock must be held
+    def forgetsentpixels(self, group=None):
+
+        if group is not None:
+
+            if len(group) == 0:
+                return
+
+            record_buffer = self.record_buffer
+            for pixel in group.indexes:
+                record_buffer[pixel] = self.UNSENT
+
+            self.markdirty(group.indexes[0], group.indexes[-1] + 1)
+            return
+
+        if self.use_numpy:
+            self.record_buffer.fill(self.UNSENT)
+        else:
+            self.record_buffer[:] = array("I", [self.UNSENT]) * self.capacity
+
+        self.markdirty(0, self.capacity)
+
+    # Sets the brightness and gamma applied when pixels are sent, for every pixel or only a group's pixels
+    def setcorrection(self, brightness=0xFF, gamma=1.0, group=None):
+
+        correction = ColorCorrection(brightness=brightness, gamma=gamma, use_numpy=self.use_numpy)
+        if correction.isidentity():
+            correction = None
+
+        # The output buffer is stale while nothing is corrected
+        was_correcting = self.correcting
+
+        if group is None:
+            self.correction = correction
+
+        else:
+
+            # Group corrections override the global one, later groups win where groups overlap
+            self.group_corrections = [(other, other_correction) for other, other_correction in self.group_corrections
+                                      if other is not group]
+            if correction is not None:
+                self.group_corrections.append((group, correction))
+
+        self.correcting = self.correction is not None or len(self.group_corrections) > 0
+
+        # Everything affected goes out again with the new levels
+        if was_correcting:
+            self.forceresend(group)
+        else:
+            self.forceresend()
+
+    # Sets the brightness applied when pixels are sent, keeping the gamma
+    def setbrightness(self, brightness, group=None):
+
+        self.setcorrection(brightness=brightness, gamma=self.getcorrection(group).gamma, group=group)
+
+    # Gets the correction that applies to a group, or the global one
+    def getcorrection(self, group=None):
+
+        if group is not None:
+            for other, correction in self.group_corrections:
+                if other is group:
+                    return correction
+
+        if self.correction is not None:
+            return self.correction
+
+        return ColorCorrection(use_numpy=False)
+
+    # Applies brightness and gamma to the changed pixels, returns the buffer to encode from
+    def correctpixels(self, changed, pixel_buffer=None):
+
+        if pixel_buffer is None:
+            pixel_buffer = self.pixel_buffer
+
+        if not self.correcting or len(changed) == 0:
+            return pixel_buffer
+
+        # Only the changed span needs correcting, the rest of the output buffer is still current
+        start = changed[0]
+        end = changed[-1] + 1
+        output_buffer = self.output_buffer
+
+        if self.correction is not None:
+            self.correction.correctrange(pixel_buffer, output_buffer, start, end)
+        else:
+            output_buffer[start:end] = pixel_buffer[start:end]
+
+        for group, correction in self.group_corrections:
+
+            if self.use_numpy:
+                indexes = group.index_array[(group.index_array >= start) & (group.index_array < end)]
+            else:
+                indexes = [pixel for pixel in group.indexes if start <= pixel < end]
+
+            correction.correctindexes(pixel_buffer, output_buffer, indexes)
+
+        return output_buffer
 
-    # Creates the list to store pixels colors
+    # Creates the buffer to store pixels colors
     def createpixelbuffer(self):
 
-        new_list = []
-        count = 0
-        while count < self.MAXLEDS:
+        if self.use_numpy:
+            return numpy.zeros(self.capacity, dtype=numpy.uint32)
 
-            new_list.append(self.BLACK)
-            count += 1
+        return array("I", [self.BLACK]) * self.capacity
 
-        return new_list
+    # Grows the pixel buffers to hold more pixels, the colors already set are kept
+    def resizebuffers(self, capacity):
+
+        old_capacity = self.capacity
+        self.capacity = capacity
+
+        for name in ("pixel_buffer", "record_buffer", "output_buffer", "reliable_colors"):
+
+            buffer = self.createpixelbuffer()
+            buffer[:old_capacity] = getattr(self, name)
+            setattr(self, name, buffer)
+
+    # Creates the frame encoder and planner for the buffer size and addressing
+    def createencoder(self):
+
+        self.encoder = FrameEncoder(self.capacity, show_command=self.COM_UPDATE_FAST, wide=self.wide_mode,
+                                    chunk_size=self.receive_buffer)
+        self.planner = UpdatePlanner(self.encoder)
 
     # Sets a pixel to a new color
     def setpixelcolor(self, pixel, color):
@@ -81,48 +359,575 @@ class LightingController:
         color = color & self.BITS24
         self.pixel_buffer[pixel] = color
 
-    # Sends updated buffer and shows all pixels
-    def updatepixels(self):
+        if pixel < self.dirty_start:
+            self.dirty_start = pixel
 
-        if self.fast_mode:
+        if pixel >= self.dirty_end:
+            self.dirty_end = pixel + 1
+
+    # Sets every pixel in a PixelGroup to a new color
+    def setgroupcolor(self, group, color):
+
+        if len(group) == 0:
+            return
+
+        color = color & self.BITS24
+        self.markdirty(group.indexes[0], group.indexes[-1] + 1)
+
+        if group.slice is not None:
 
-            self.updatepixelsfast()
+            if self.use_numpy:
+                self.pixel_buffer[group.slice] = color
+            else:
+                self.pixel_buffer[group.slice] = array("I", [color]) * len(group)
+
+        elif self.use_numpy:
+
+            self.pixel_buffer[group.index_array] = color
 
         else:
 
-            self.updatepixelsslow()
+            pixel_buffer = self.pixel_buffer
+            for pixel in group.indexes:
+                pixel_buffer[pixel] = color
 
-    # Update the pixels in fast mode
-    def updatepixelsfast(self):
+    # Sends updated buffer and shows all pixels, nothing is sent if no pixel changed
+    # A ControllerGroup passes a barrier every port waits at between sending and showing
+    def updatepixels(self, barrier=None):
 
-        count = 0
-        while count < self.length:
+        # The writer thread sends it
+        if self.writer_thread is not None:
+            self.queueframe()
+            return
 
-            # Create and send command if pixel changed
-            if self.pixel_buffer[count] != self.record_buffer[count]:
-                pixel_command = self.create_command_fast(count, self.pixel_buffer[count])
-                self.ser.write(pixel_command)
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
 
-            count += 1
+        # The strip already shows the buffer
+        changed = self.changedpixels()
+        if len(changed) == 0:
+            self.copytorecordbuffer()
+            if barrier is not None:
+                barrier.wait()
+            return
 
-        self.showneopixels()
+        self.writepixels(changed, self.pixel_buffer, barrier)
         self.copytorecordbuffer()
 
-    # Updates the pixels in slow mode
-    def updatepixelsslow(self):
+        if metrics is not None:
+            metrics.recordframe(len(changed), time.perf_counter() - start)
 
-        count = 0
-        while count < self.length:
+    # Corrects, records and sends the changed pixels of a buffer, the record buffer is left to the caller
+    # Everything up to showing is done before waiting at the barrier
+    def writepixels(self, changed, pixel_buffer, barrier=None):
 
-            # Create and send command if pixel changed
-            if self.pixel_buffer[count] != self.record_buffer[count]:
-                pixel_command = self.create_command(self.COM_SET_ONE, [count, self.pixel_buffer[count]])
-                self.sendslowcommand(pixel_command)
+        # Shows are recorded uncorrected, the controller playing them back applies its own correction
+        if self.recorder is not None:
+            self.recorder.recordframe(pixel_buffer)
 
-            count += 1
+        colors = self.correctpixels(changed, pixel_buffer)
 
-        self.showneopixels()
-        self.copytorecordbuffer()
+        # Reliable packets are numbered as they are written and show on receipt
+        if self.fast_mode and self.reliable_mode:
+
+            if barrier is not None:
+                barrier.wait()
+
+            self.updatepixelsreliable(changed, colors)
+
+        # Fast lines end with the show command, frame and palette commands show on receipt
+        elif self.fast_mode:
+
+            data = self.encodechanges(changed, colors)
+            if barrier is not None:
+                barrier.wait()
+
+            self.ser.write(data)
+
+        else:
+
+            self.sendpixels(changed, colors)
+            if barrier is not None:
+                barrier.wait()
+
+            self.showneopixels()
+
+    # Encodes changed pixels for fast, frame or palette mode, the data shows them
+    def encodechanges(self, changed, colors):
+
+        # The planner sends a frame instead when indexes wouldn't be smaller
+        if self.palette_mode:
+            return self.planner.planpalette(colors, changed, self.palette)
+
+        # The planner falls back to fast lines when the changes are too scattered for one frame
+        if self.frame_mode:
+            return self.planner.planframe(colors, changed)
+
+        return self.encoder.encodefast(colors, changed)
+
+    # Hands a snapshot of the buffer to the writer thread, a full queue gives way to the newest frame
+    def queueframe(self):
+
+        # Nothing was written since the last update
+        if self.dirty_start >= self.dirty_end:
+            return
+
+        if self.use_numpy:
+            frame = self.pixel_buffer[:self.length].copy()
+        else:
+            frame = self.pixel_buffer[:self.length]
+
+        self.dirty_start = self.capacity
+        self.dirty_end = 0
+
+        # Snapshots hold every pixel, so frames that never go out lose nothing the newer frame doesn't carry
+        with self.writer_condition:
+
+            if len(self.queued_frames) >= self.queue_size:
+
+                self.queued_frames.popleft()
+                if self.queue_size == 1:
+                    self.writer_stats["coalesced"] += 1
+                else:
+                    self.writer_stats["dropped"] += 1
+
+            self.queued_frames.append(frame)
+            self.writer_stats["queued"] += 1
+            self.writer_condition.notify_all()
+
+    # Sends queued snapshots until background mode ends, runs on the writer thread
+    def writeframes(self):
+
+        try:
+            while True:
+
+                with self.writer_condition:
+
+                    while len(self.queued_frames) == 0 and self.queue_size > 0:
+                        self.writer_condition.wait()
+
+                    if len(self.queued_frames) == 0:
+                        return
+
+                    frame = self.queued_frames.popleft()
+                    self.writing = True
+
+                self.writeframe(frame)
+
+                with self.writer_condition:
+                    self.writing = False
+                    self.writer_condition.notify_all()
+
+        finally:
+            with self.writer_condition:
+                self.writing = False
+                self.writer_condition.notify_all()
+
+    # Sends the pixels of a snapshot that differ from what the strip shows, runs on the writer thread
+    def writeframe(self, frame):
+
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+
+        with self.writer_condition:
+
+            record_buffer = self.record_buffer
+            if self.use_numpy:
+                changed = numpy.flatnonzero(frame != record_buffer[:self.length]).tolist()
+            else:
+                changed = [count for count, (pixel, record) in enumerate(zip(frame, record_buffer)) if pixel != record]
+
+            # Marked sent before writing so a resend requested meanwhile isn't lost
+            record_buffer[:self.length] = frame
+
+        if len(changed) == 0:
+            return
+
+        self.writepixels(changed, frame)
+        with self.writer_condition:
+            self.writer_stats["sent"] += 1
+
+        if metrics is not None:
+            metrics.recordframe(len(changed), time.perf_counter() - start)
+
+    # Waits until the writer thread has sent every queued frame
+    def flushframes(self):
+
+        with self.writer_condition:
+
+            while ((len(self.queued_frames) > 0 or self.writing) and self.writer_thread is not None
+                   and self.writer_thread.is_alive()):
+                self.writer_condition.wait(self.WRITER_TIMEOUT)
+
+    # Sends updates from a writer thread so updatepixels returns at once
+    # queue_size 1 keeps only the newest frame, more queues frames and drops the oldest when full, 0 turns it off
+    def enablebackgroundmode(self, queue_size=0):
+
+        if queue_size < 0:
+            queue_size = 0
+
+        # Start the writer
+        if queue_size > 0 and self.writer_thread is None:
+
+            self.queue_size = queue_size
+
+            # Pixels set before now still have to go out
+            self.markdirty(0, self.length)
+            self.writer_thread = threading.Thread(target=self.writeframes, daemon=True)
+            self.writer_thread.start()
+
+        # Send what is queued and stop the writer
+        elif queue_size == 0 and self.writer_thread is not None:
+
+            self.flushframes()
+            with self.writer_condition:
+                self.queue_size = 0
+                self.writer_condition.notify_all()
+
+            self.writer_thread.join()
+            self.writer_thread = None
+
+            # The record buffer holds what the writer sent, pixels set since go out with the next update
+            return
+
+        with self.writer_condition:
+            self.queue_size = queue_size
+
+            # A smaller queue keeps the newest frames
+            while len(self.queued_frames) > queue_size:
+                self.queued_frames.popleft()
+                self.writer_stats["dropped"] += 1
+
+            self.writer_condition.notify_all()
+
+    # Gets the background mode statistics
+    def getwriterstats(self):
+
+        with self.writer_condition:
+            stats = dict(self.writer_stats)
+            stats["pending"] = len(self.queued_frames)
+
+        return stats
+
+    # Update the pixels in reliable mode, the packets are kept until the device acknowledges them
+    def updatepixelsreliable(self, changed=None, colors=None):
+
+        if changed is None:
+            changed = self.changedpixels()
+
+        if colors is None:
+            colors = self.correctpixels(changed)
+
+        if len(changed) == 0:
+            return
+
+        start = changed[0]
+        end = changed[-1] + 1
+        with self.reliable_lock:
+            self.reliable_colors[start:end] = colors[start:end]
+            self.sendreliable(start, end)
+
+    # Sends the reliable colors from start up to end as numbered packets, the reliable lock must be held
+    def sendreliable(self, start, end):
+
+        data, packets = self.encoder.encodereliable(self.reliable_colors, start, end, self.sequence)
+
+        # Remember the packets before writing so an early NAK finds them
+        with self.window_condition:
+
+            sent = time.monotonic()
+            for sequence, packet_start, packet_end in packets:
+                self.unacknowledged.append((sequence, packet_start, packet_end, sent))
+
+            self.sequence = (self.sequence + len(packets)) & self.encoder.SEQUENCE_MASK
+            self.reliable_stats["packets"] += len(packets)
+
+            # Too many packets in flight to tell sequence numbers apart, start over from a keyframe
+            if len(self.unacknowledged) > self.RELIABLE_WINDOW:
+                self.unacknowledged.clear()
+                self.lost_everything = True
+
+        self.ser.write(data)
+
+    # Handles an ACK or NAK line from the device, runs on the reader thread with the window lock held
+    def handleacknowledgement(self, result):
+
+        try:
+            sequence = int(result[len(self.COM_ACK):].strip(), 16)
+        except ValueError:
+            return
+
+        unacknowledged = self.unacknowledged
+        mask = self.encoder.SEQUENCE_MASK
+
+        # Every packet up to the sequence arrived
+        if result.startswith(self.COM_ACK):
+
+            self.reliable_stats["acks"] += 1
+            while len(unacknowledged) > 0 and (sequence - unacknowledged[0][0]) & mask <= mask // 2:
+                unacknowledged.popleft()
+
+            return
+
+        # One packet was lost, its pixels are sent again, a packet already forgotten needs a keyframe
+        self.reliable_stats["naks"] += 1
+        for packet in unacknowledged:
+
+            if packet[0] == sequence:
+                unacknowledged.remove(packet)
+                self.lost_ranges.append((packet[1], packet[2]))
+                return
+
+        self.lost_everything = True
+
+    # Sends the pixels of packets the device lost or never acknowledged again, runs on the reader thread
+    # so a frame that is held still gets repaired
+    def resendlostpixels(self):
+
+        with self.reliable_lock:
+
+            if not self.reliable_mode:
+                return
+
+            with self.window_condition:
+
+                # Packets unacknowledged for too long are taken as lost
+                expired = time.monotonic() - self.ACK_TIMEOUT
+                unacknowledged = self.unacknowledged
+                while len(unacknowledged) > 0 and unacknowledged[0][3] < expired:
+                    sequence, start, end, sent = unacknowledged.popleft()
+                    self.lost_ranges.append((start, end))
+                    self.reliable_stats["timeouts"] += 1
+
+                lost_ranges = sorted(self.lost_ranges)
+                lost_everything = self.lost_everything
+                self.lost_ranges = []
+                self.lost_everything = False
+
+            if lost_everything:
+                self.reliable_stats["keyframes"] += 1
+                lost_ranges = [(0, self.length)]
+
+            # Overlapping and touching ranges go out together
+            merged = []
+            for start, end in lost_ranges:
+
+                if len(merged) > 0 and start <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+                else:
+                    merged.append((start, end))
+
+            for start, end in merged:
+                self.sendreliable(start, end)
+                self.reliable_stats["resent_pixels"] += end - start
+
+    # Marks lost pixels as unsent so the next update sends them, used once reliable mode is off
+    def forgetlostpixels(self, lost_ranges, lost_everything=False):
+
+        if lost_everything:
+            self.forceresend()
+            return
+
+        # The writer thread compares against the record buffer
+        with self.writer_condition:
+
+            record_buffer = self.record_buffer
+            for start, end in lost_ranges:
+
+                if self.use_numpy:
+                    record_buffer[start:end] = self.UNSENT
+                else:
+                    record_buffer[start:end] = array("I", [self.UNSENT]) * (end - start)
+
+                self.markdirty(start, end)
+
+    # Waits until the device acknowledged every packet and every lost pixel was sent again, or FLUSH_TIMEOUT
+    def flushreliable(self):
+
+        deadline = time.monotonic() + self.FLUSH_TIMEOUT
+        with self.window_condition:
+
+            while ((len(self.unacknowledged) > 0 or len(self.lost_ranges) > 0 or self.lost_everything)
+                   and self.reader_thread is not None and self.reader_thread.is_alive()):
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                # Losses found by the reader don't notify
+                self.window_condition.wait(min(remaining, self.READER_TIMEOUT))
+
+    # Sends fast mode updates as numbered, checksummed packets, anything the device loses is sent again
+    def enablereliablemode(self, reliable_mode=False):
+
+        if reliable_mode == self.reliable_mode:
+            return
+
+        if reliable_mode:
+
+            self.enablefastmode(fast_mode=True)
+            self.flushframes()
+
+            # The strip shows the record buffer, unsent pixels have no color to correct
+            # They are taken as black until the next update sends them
+            with self.writer_condition:
+
+                shown = self.record_buffer[:self.length]
+                if self.use_numpy:
+                    shown = shown.copy()
+                    unsent = numpy.flatnonzero(shown == self.UNSENT).tolist()
+                    shown[unsent] = self.BLACK
+                else:
+                    unsent = [pixel for pixel, color in enumerate(shown) if color == self.UNSENT]
+                    for pixel in unsent:
+                        shown[pixel] = self.BLACK
+
+                if len(unsent) > 0:
+                    self.markdirty(unsent[0], unsent[-1] + 1)
+
+                colors = self.correctpixels([0, self.length - 1], shown)[:self.length]
+
+            with self.reliable_lock:
+
+                self.reliable_colors[:self.length] = colors
+
+                with self.window_condition:
+                    self.unacknowledged.clear()
+                    self.lost_ranges = []
+                    self.lost_everything = False
+                    self.reliable_mode = True
+
+            self.startreader()
+            return
+
+        # Let the device acknowledge what is in flight so no ACK is left for a slow command to read
+        self.flushframes()
+        self.flushreliable()
+
+        with self.reliable_lock:
+            with self.window_condition:
+
+                self.reliable_mode = False
+
+                # Anything still unacknowledged might be lost
+                lost_ranges = self.lost_ranges
+                for sequence, start, end, sent in self.unacknowledged:
+                    lost_ranges.append((start, end))
+
+                lost_everything = self.lost_everything
+                self.unacknowledged.clear()
+                self.lost_ranges = []
+                self.lost_everything = False
+
+        if self.window_size == 1:
+            self.stopreader()
+
+        # The next update sends the lost pixels the usual way
+        self.forgetlostpixels(lost_ranges, lost_everything)
+
+    # Gets the reliable mode statistics
+    def getreliablestats(self):
+
+        with self.window_condition:
+            stats = dict(self.reliable_stats)
+            stats["unacknowledged"] = len(self.unacknowledged)
+
+        return stats
+
+    # Sends the changed pixels without showing them
+    def sendpixels(self, changed=None, colors=None):
+
+        if changed is None:
+            changed = self.changedpixels()
+
+        if colors is None:
+            colors = self.correctpixels(changed)
+
+        if self.fast_mode:
+            self.ser.write(self.encoder.encodefast(colors, changed, show=False))
+            return
+
+        # Send the planned commands, runs of one color go as a single command
+        for pixel_command in self.planner.planslow(colors, changed, self.length):
+            self.sendslowcommand(pixel_command)
+
+    # Gets the indexes of pixels that changed since the last update, only the dirty range is compared
+    def changedpixels(self):
+
+        start = self.dirty_start
+        end = min(self.dirty_end, self.length)
+        if start >= end:
+            return []
+
+        if self.use_numpy:
+            return (numpy.flatnonzero(self.pixel_buffer[start:end] != self.record_buffer[start:end]) + start).tolist()
+
+        # Range comparison runs in C, only scan when something changed
+        pixel_buffer = self.pixel_buffer[start:end]
+        record_buffer = self.record_buffer[start:end]
+        if pixel_buffer == record_buffer:
+            return []
+
+        return [count for count, (pixel, record) in enumerate(zip(pixel_buffer, record_buffer), start)
+                if pixel != record]
+
+    # Encodes pixels of a color buffer for the current mode, None in slow and palette mode
+    def encodepixels(self, colors, indexes):
+
+        # Palette slots and reliable sequence numbers depend on what was sent before, so those can't be encoded ahead
+        if not self.fast_mode or self.palette_mode or self.reliable_mode:
+            return None
+
+        # The writer thread encodes into the same buffers, wait out the frame it is sending and keep it from
+        # starting another until the copy is made
+        with self.writer_condition:
+
+            while self.writing:
+                self.writer_condition.wait()
+
+            if self.frame_mode:
+
+                if len(indexes) == 0:
+                    return bytes(self.encoder.encodeframe(colors, 0, 0))
+
+                return bytes(self.encoder.encodeframe(colors, min(indexes), max(indexes) + 1))
+
+            return bytes(self.encoder.encodefast(colors, indexes))
+
+    # Sets pixels to new colors without the length check
+    def setpixelcolors(self, indexes, colors):
+
+        if len(indexes) == 0:
+            return
+
+        self.markdirty(min(indexes), max(indexes) + 1)
+
+        pixel_buffer = self.pixel_buffer
+        for index, color in zip(indexes, colors):
+            pixel_buffer[index] = color
+
+    # Sends a precompiled frame, data comes from encodepixels
+    def sendframe(self, indexes, colors, data=None):
+
+        self.setpixelcolors(indexes, colors)
+
+        # Nothing precompiled, send the changes the usual way, precompiled data has no correction applied
+        # and the writer thread works from snapshots
+        if (data is None or not self.fast_mode or self.correcting or self.writer_thread is not None
+                or self.reliable_mode):
+            self.updatepixels()
+            return
+
+        if self.recorder is not None:
+            self.recorder.recordframe(self.pixel_buffer)
+
+        record_buffer = self.record_buffer
+        for index, color in zip(indexes, colors):
+            record_buffer[index] = color
+
+        self.ser.write(data)
 
     # Sends command to update neopixels
     def showneopixels(self):
@@ -148,13 +953,218 @@ class LightingController:
 
     # Sends a command in slow mode
     def sendslowcommand(self, command):
+
+        if self.window_size > 1:
+            return self.sendwindowedcommand(command)
+
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+
         self.ser.write(command)
         result = self.ser.readline()
+
+        # Late acknowledgements from reliable mode aren't responses
+        while result.startswith(self.COM_ACK) or result.startswith(self.COM_NAK):
+            result = self.ser.readline()
+
+        if metrics is not None:
+            metrics.recordack(time.perf_counter() - start, result == self.COM_RECEIVED)
+
         if result == self.COM_RECEIVED:
             return True
         else:
             return False
 
+    # Sends a command without waiting for its response, blocks while the window is full
+    # Returns False if a command was rejected since the last flush, flushcommands waits for the rest
+    def sendwindowedcommand(self, command):
+
+        with self.window_condition:
+
+            self.waitforresponses(lambda: len(self.pending_commands) < self.window_size)
+
+            # Queue before writing so the reader never sees an unmatched response
+            self.pending_commands.append((command, time.perf_counter()))
+            success = len(self.invalid_commands) == 0
+
+        # The reader keeps matching responses while a write blocks
+        self.ser.write(command)
+        return success
+
+    # Waits with the window lock held until ready returns True, the reader notifies as responses come in
+    # Raises what stopped the reader, or SerialTimeoutException once no response came for RESPONSE_TIMEOUT
+    def waitforresponses(self, ready):
+
+        pending = len(self.pending_commands)
+        deadline = time.monotonic() + self.RESPONSE_TIMEOUT
+        while True:
+
+            if self.reader_error is not None:
+                raise self.reader_error
+
+            if ready():
+                return
+
+            # Nothing will answer
+            if self.reader_thread is None or not self.reader_thread.is_alive():
+                return
+
+            # Every response gives the next one the whole timeout
+            if len(self.pending_commands) < pending:
+                pending = len(self.pending_commands)
+                deadline = time.monotonic() + self.RESPONSE_TIMEOUT
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+
+                # The responses are lost, later ones must not be matched to these commands
+                self.invalid_commands.extend(command for command, sent in self.pending_commands)
+                self.pending_commands.clear()
+                raise serial.SerialTimeoutException("No response from %s for %s seconds"
+                                                    % (self.port, self.RESPONSE_TIMEOUT))
+
+            self.window_condition.wait(remaining)
+
+    # Matches responses to outstanding commands, runs on the reader thread
+    # An error stops the reader and is raised to whoever waits on it next
+    def readresponses(self):
+
+        try:
+            self.matchresponses()
+
+        except Exception as error:
+            with self.window_condition:
+                self.reader_error = error
+                self.window_condition.notify_all()
+
+    # Reads responses until nothing is left for the reader, runs on the reader thread
+    def matchresponses(self):
+
+        while self.window_size > 1 or len(self.pending_commands) > 0 or self.reliable_mode:
+
+            # Checked every line or READER_TIMEOUT, so lost packets are repaired while a frame is held
+            if self.reliable_mode:
+                self.resendlostpixels()
+
+            result = self.ser.readline()
+            if len(result) == 0:
+                continue
+
+            with self.window_condition:
+
+                if result.startswith(self.COM_ACK) or result.startswith(self.COM_NAK):
+                    self.handleacknowledgement(result)
+                    self.window_condition.notify_all()
+                    continue
+
+                if len(self.pending_commands) == 0:
+                    continue
+
+                command, sent = self.pending_commands.popleft()
+                if result != self.COM_RECEIVED:
+                    self.invalid_commands.append(command)
+
+                metrics = self.metrics
+                if metrics is not None:
+                    metrics.recordack(time.perf_counter() - sent, result == self.COM_RECEIVED)
+
+                self.window_condition.notify_all()
+
+    # Waits for all outstanding commands, returns False if any were invalid since the last flush
+    def flushcommands(self):
+
+        with self.window_condition:
+
+            self.waitforresponses(lambda: len(self.pending_commands) == 0)
+
+            # Keep the rejected commands around for the caller
+            success = len(self.invalid_commands) == 0
+            self.flushed_invalid_commands = self.invalid_commands
+            self.invalid_commands = []
+
+        return success
+
+    # Starts the thread reading responses and acknowledgements, begin starts it if the port isn't open yet
+    def startreader(self):
+
+        # A reader stopped by an error is replaced
+        if self.reader_thread is not None:
+
+            if self.reader_thread.is_alive():
+                return
+
+            self.stopreader()
+
+        if not self.ser.is_open:
+            return
+
+        self.reader_error = None
+        self.reader_timeout = self.ser.timeout
+        self.ser.timeout = self.READER_TIMEOUT
+        self.reader_thread = threading.Thread(target=self.readresponses, daemon=True)
+        self.reader_thread.start()
+
+    # Stops the reader thread, it ends once nothing is left for it to read
+    def stopreader(self):
+
+        if self.reader_thread is None:
+            return
+
+        self.reader_thread.join()
+        self.reader_thread = None
+        self.ser.timeout = self.reader_timeout
+
+    # Keeps up to window_size slow commands in flight, 1 waits for every response
+    def enablewindowedmode(self, window_size=1):
+
+        if window_size < 1:
+            window_size = 1
+
+        # Start the response reader
+        if window_size > 1:
+
+            self.window_size = window_size
+            self.startreader()
+
+        # Drain outstanding commands and stop the reader unless reliable mode still needs it
+        elif self.reader_thread is not None:
+
+            # A reader that stopped on an error is still stopped
+            try:
+                self.flushcommands()
+
+            finally:
+                self.window_size = window_size
+                if not self.reliable_mode:
+                    self.stopreader()
+
+        with self.window_condition:
+            self.window_size = window_size
+            self.window_condition.notify_all()
+
+    # Turns the hot path metrics on or off, returns the ControllerMetrics or None
+    def enablemetrics(self, enabled=True):
+
+        # Writes are timed by wrapping the port, so nothing is left on the write path when disabled
+        if enabled and self.metrics is None:
+            self.metrics = ControllerMetrics()
+            self.ser = MeteredSerial(self.ser, self.metrics)
+
+        elif not enabled and self.metrics is not None:
+            self.ser = self.ser.ser
+            self.metrics = None
+
+        return self.metrics
+
+    # Gets a snapshot of the hot path metrics, None while disabled
+    def getmetrics(self):
+
+        if self.metrics is None:
+            return None
+
+        return self.metrics.snapshot()
+
     def enablefastmode(self, fast_mode=False):
 
         # Check if already in mode
@@ -166,6 +1176,13 @@ class LightingController:
 
             return
 
+        # Queued frames go out in the mode they were made for
+        self.flushframes()
+
+        # Reliable mode needs fast mode
+        if not fast_mode:
+            self.enablereliablemode(reliable_mode=False)
+
         # Change mode
         if fast_mode:
             self.sendslowcommand(self.COM_ENTER_FAST)
@@ -173,14 +1190,39 @@ class LightingController:
         else:
             self.sendslowcommand(self.COM_EXIT_FAST)
 
+        # Make sure the mode change was handled before switching protocols
+        if self.window_size > 1:
+            self.flushcommands()
+
         # Update mode
         self.fast_mode = fast_mode
 
+        # Frame and palette mode need fast mode
+        if not fast_mode:
+            self.frame_mode = False
+            self.palette_mode = False
+
+    # Sends whole frames as one binary command instead of one line per pixel
+    def enableframemode(self, frame_mode=False):
+
+        if frame_mode:
+            self.enablefastmode(fast_mode=True)
+
+        self.frame_mode = frame_mode
+
+    # Sends pixels as 1 byte palette slots, uploading colors to the device as they are needed
+    def enablepalettemode(self, palette_mode=False):
+
+        if palette_mode:
+            self.enablefastmode(fast_mode=True)
+
+        self.palette_mode = palette_mode
+
     # Creates a pixel color change command for fast mode
     def create_command_fast(self, command, param):
 
         new_command = ""
-        new_command += self.createhexvalue(command, 2) + ":"
+        new_command += self.createhexvalue(command, 4 if self.wide_mode else 2) + ":"
         new_command += self.createhexvalue(param, 6) + "\n"
         return bytes(new_command, encoding="utf8")
 
@@ -206,6 +1248,22 @@ class LightingController:
         return bytes(new_command, encoding="utf8")
 
 
+    # Creates the command that sets the length and initial color
+    def create_command_init(self):
+
+        if self.wide_mode:
+            init_command = "{" + self.COM_INIT_WIDE + ":"
+            init_command += self.createhexvalue(self.length, 4)
+        else:
+            init_command = "{INIT:"
+            init_command += self.createhexvalue(self.length, 2)
+
+        init_command += ","
+        init_command += self.createhexvalue(self.color, 6)
+        init_command += "}\n"
+
+        return bytes(init_command, encoding="utf8")
+
     # Sets the serial port
     def setport(self, port):
 
@@ -214,20 +1272,45 @@ class LightingController:
     # Sets the number of neopixels
     def setlength(self, length):
 
-        if length > self.MAXLEDS:
-            length = self.MAXLEDS
+        if length > self.MAXLEDS_WIDE:
+            length = self.MAXLEDS_WIDE
 
         self.length = length
 
+        # Only wide addressing reaches past MAXLEDS
+        if length > self.MAXLEDS:
+            self.enablewidemode(wide_mode=True, receive_buffer=self.receive_buffer)
+
+    # Addresses pixels with 16 bit indexes, set before begin since INIT tells the device
+    # Frames are split into packets of at most receive_buffer bytes
+    def enablewidemode(self, wide_mode=False, receive_buffer=RECEIVE_BUFFER):
+
+        if self.length is not None and self.length > self.MAXLEDS:
+            wide_mode = True
+
+        self.wide_mode = wide_mode
+        self.receive_buffer = receive_buffer
+
+        if self.length is not None and self.length > self.capacity:
+            self.resizebuffers(self.length)
+
+        self.createencoder()
+
     # Sets initial color
     def setcolor(self, color):
 
         self.color = (self.BITS24 & color)
 
-    # Closes the serial port
+    # Closes the serial port, even if the reader stopped on an error
     def end(self):
 
-        self.ser.close()
+        try:
+            self.enablebackgroundmode(queue_size=0)
+            self.enablereliablemode(reliable_mode=False)
+            self.enablewindowedmode(window_size=1)
+
+        finally:
+            self.ser.close()
 
     # Starts communication and shows the initial color
     def begin(self, autodetect=False):
@@ -257,7 +1340,7 @@ class LightingController:
 
             # Check port
             result = self.ser.readline()
-            if result != b"READY\n":
+            if result != self.COM_READY:
 
                 self.ser.close()
                 return False
@@ -266,14 +1349,11 @@ class LightingController:
         if self.color is None:
             self.color = self.BLACK
 
-        # Send length
-        init_command = "{INIT:"
-        init_command += self.createhexvalue(self.length, 2)
-        init_command += ","
-        init_command += self.createhexvalue(self.color, 6)
-        init_command += "}\n"
+        # The device starts with an empty palette
+        self.palette.reset()
 
-        self.ser.write(bytes(init_command, encoding="utf8"))
+        # Send length
+        self.ser.write(self.create_command_init())
         result = self.ser.readline()
         if result != self.COM_RECEIVED:
             self.ser.close()
@@ -286,6 +1366,10 @@ class LightingController:
             self.ser.close()
             return False
 
+        # Windowed or reliable mode enabled before the port was open
+        if self.window_size > 1 or self.reliable_mode:
+            self.startreader()
+
         # Success
         return True
 
@@ -294,40 +1378,142 @@ class LightingController:
 
         return hex(number).lstrip("0x").rstrip("L").zfill(characters).upper()
 
-    # Tries to autodetect the port
-    def autodetectport(self):
+    # Lists the ports a controller could be on as (port, USB serial number or None)
+    def listcandidateports(self):
 
-        # Loop through all serial ports to find the correct one
-        count = 1
-        detected = False
-        while count < 256:
+        candidates = []
+        seen = set()
+        for info in list_ports.comports():
+            candidates.append((info.device, info.serial_number))
+            seen.add(os.path.realpath(info.device))
 
-            # Set attempt variables
-            self.ser.setPort("COM" + str(count))
-            self.ser.timeout = 3
+        # Catch devices the port listing missed, by-id links point at the same devices
+        for pattern in self.PORT_PATTERNS:
+            for path in sorted(glob.glob(pattern)):
+
+                device = os.path.realpath(path)
+                if device not in seen:
+                    candidates.append((device, None))
+                    seen.add(device)
+
+        return candidates
+
+    # Opens a port and waits for READY, returns the open port or None
+    def probeport(self, port, deadline, found):
+
+        try:
+            ser = serial.Serial(port=port, baudrate=self.BAUDRATE, timeout=self.PROBE_INTERVAL)
+        except (serial.SerialException, OSError):
+            return None
+
+        # Read in short slices so probes give up as soon as another port answers
+        line = b""
+        while time.monotonic() < deadline and not found.is_set():
 
-            # Try to open the port
             try:
-                self.ser.open()
+                line += ser.readline()
+            except (serial.SerialException, OSError):
+                break
 
-            except serial.SerialException:
-                self.ser.close()
+            if line.endswith(b"\n"):
+
+                if line == self.COM_READY:
+                    found.set()
+                    return ser
+
+                line = b""
+
+        ser.close()
+        return None
+
+    # Probes ports at once, returns (port, open serial) for the first to answer or (None, None)
+    def probeports(self, ports):
+
+        if len(ports) == 0:
+            return None, None
+
+        deadline = time.monotonic() + self.BOOT_TIME + self.PROBE_TIMEOUT
+        found = threading.Event()
+        with ThreadPoolExecutor(max_workers=len(ports)) as pool:
+            results = list(pool.map(lambda port: self.probeport(port, deadline, found), ports))
+
+        # Two ports could answer together, keep the first
+        detected_port = None
+        detected_ser = None
+        for port, ser in zip(ports, results):
+
+            if ser is None:
                 continue
 
-            # Port found, check if correct
-            result = self.ser.readline()
+            if detected_ser is None:
+                detected_port = port
+                detected_ser = ser
+            else:
+                ser.close()
 
-            if result == "READY\n":
-                detected = True
-                self.ser.close()
-                break
+        return detected_port, detected_ser
+
+    # Reads the last detected port as a dictionary with port and serial_number
+    def loadcachedport(self):
+
+        try:
+            with open(self.PORT_CACHE) as cache_file:
+                return json.load(cache_file)
+
+        except (OSError, ValueError):
+            return None
+
+    # Remembers a detected port for the next run
+    def savecachedport(self, port, serial_number):
 
-            count += 1
+        try:
+            with open(self.PORT_CACHE, "w") as cache_file:
+                json.dump({"port": port, "serial_number": serial_number}, cache_file)
+
+        except OSError:
+            pass
+
+    # Tries to autodetect the port, leaves it open with READY already read
+    def autodetectport(self):
+
+        candidates = self.listcandidateports()
+        serial_numbers = dict(candidates)
+        ports = [port for port, serial_number in candidates]
+
+        # Try the last good device first, found by serial number since port names move between boots
+        cached = self.loadcachedport()
+        detected_port = None
+        detected_ser = None
+        if cached is not None:
+
+            cached_port = cached.get("port")
+            if cached.get("serial_number") is not None:
+                cached_port = None
+                for port, serial_number in candidates:
+                    if serial_number == cached.get("serial_number"):
+                        cached_port = port
+
+            if cached_port in serial_numbers:
+                detected_port, detected_ser = self.probeports([cached_port])
+                ports.remove(cached_port)
+
+        # Probe everything else at once
+        if detected_ser is None:
+            detected_port, detected_ser = self.probeports(ports)
 
         # Didn't find the port
-        if not detected:
+        if detected_ser is None:
             return False
 
+        # Use the port the probe opened, reopening would reset the board again
+        detected_ser.timeout = self.ser.timeout
+        self.ser = detected_ser
+
+        # Keep timing writes if metrics were enabled before the port was found
+        if self.metrics is not None:
+            self.ser = MeteredSerial(detected_ser, self.metrics)
+        self.setport(detected_port)
+        self.savecachedport(detected_port, serial_numbers.get(detected_port))
+
         # Success
         return True
-
@@ -1,5 +1,7 @@
-import time
+import argparse
 import falcon
+from scheduler import VirtualClock
+from showFile import ShowRecorder, ShowPlayer
 
 # TODO
 # Create rgb class
@@ -9,43 +11,90 @@ import falcon
 
 """
 
-if __name__ == "__main__":
-
-    mf = falcon.MillenniumFalcon("COM5")
 
-    # mf.canyouguess()
-    # mf.lighttest()
-    # mf.testalllighttypes()
-    # mf.quickdisplay()
+def runshow(mf):
+    """
+    Runs the show sequences
+    :param mf: MillenniumFalcon with a show started
+    :return: None
+    """
 
     # while True:
     mf.enginekill()
-    time.sleep(2)
+    mf.wait(2)
 
     mf.startupengines()
-    time.sleep(2)
+    mf.wait(2)
     mf.takingoff()
 
     mf.losingpower()
-    time.sleep(3)
+    mf.wait(3)
 
     mf.restartengines()
-    time.sleep(4)
+    mf.wait(4)
 
     mf.fireeverything()
 
-    time.sleep(5)
+    mf.wait(5)
 
     mf.landing()
 
-    time.sleep(2)
+    mf.wait(2)
     mf.startupengines()
-    time.sleep(2)
+    mf.wait(2)
     mf.takingoff()
-    time.sleep(2)
+    mf.wait(2)
 
     mf.gotohyperspace()
-    time.sleep(5)
+    mf.wait(5)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run the Millennium Falcon show")
+    parser.add_argument("--port", default="COM5")
+    parser.add_argument("--record", default=None, help="Render the show into a show file without a device")
+    parser.add_argument("--play", default=None, help="Play a recorded show file instead of rendering")
+    args = parser.parse_args()
+
+    # Render offline as fast as the frames can be computed
+    if args.record is not None:
+
+        mf = falcon.MillenniumFalcon(None)
+        clock = VirtualClock()
+        recorder = ShowRecorder(args.record, clock=clock)
+        recorder.start(mf.con, offline=True)
+
+        mf.startshow(clock=clock)
+        runshow(mf)
+        mf.endshow()
+
+        print(recorder.stop(), "frames recorded")
+
+    elif args.play is not None:
+
+        # Fast mode firmware takes the recorded packets as they are
+        mf = falcon.MillenniumFalcon(args.port)
+        mf.enablefastmode(fast_mode=True)
+        player = ShowPlayer(args.play)
+        mf.startshow()
+        player.play(mf.con, scheduler=mf.getscheduler())
+        print(mf.endshow())
+        player.close()
+
+    else:
+
+        mf = falcon.MillenniumFalcon(args.port)
+
+        # mf.canyouguess()
+        # mf.lighttest()
+        # mf.testalllighttypes()
+        # mf.quickdisplay()
+
+        # Run the whole show on one clock
+        mf.startshow()
+        runshow(mf)
+        print(mf.endshow())
 
     """
     sleep_time = 0.1
@@ -0,0 +1,267 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Histogram bucket upper bounds
+SECONDS_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+PIXEL_BUCKETS = [0, 1, 2, 5, 10, 25, 50, 100, 255, 1000, 10000]
+
+
+# histogram with fixed buckets, cheap enough to observe every frame
+class Histogram:
+
+    def __init__(self, buckets):
+        """
+        Constructor
+        :param buckets: Sorted bucket upper bounds, values above the last go in an overflow bucket
+        """
+
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        """
+        Records one value
+        :param value: The value
+        :return: None
+        """
+
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self):
+        """
+        Gets the histogram's state
+        :return: Dictionary with count, sum, mean, max and cumulative bucket counts
+        """
+
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            total += count
+            cumulative.append([bound, total])
+
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count > 0 else 0,
+            "max": self.max,
+            "buckets": cumulative,
+        }
+
+
+# counters and histograms for one controller, updated from the caller's, writer and reader threads
+class ControllerMetrics:
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+
+        # Counters
+        self.frames_sent = 0
+        self.bytes_written = 0
+        self.writes = 0
+        self.invalid_commands = 0
+
+        # Histograms
+        self.pixels_changed = Histogram(PIXEL_BUCKETS)
+        self.write_seconds = Histogram(SECONDS_BUCKETS)
+        self.ack_seconds = Histogram(SECONDS_BUCKETS)
+        self.update_seconds = Histogram(SECONDS_BUCKETS)
+
+    def recordframe(self, pixels_changed, seconds):
+        """
+        Records one updatepixels call
+        :param pixels_changed: Pixels sent in the frame
+        :param seconds: Time spent in updatepixels
+        :return: None
+        """
+
+        with self.lock:
+            self.frames_sent += 1
+            self.pixels_changed.observe(pixels_changed)
+            self.update_seconds.observe(seconds)
+
+    def recordwrite(self, byte_count, seconds):
+        """
+        Records one serial write
+        :param byte_count: Bytes written
+        :param seconds: Time the write blocked
+        :return: None
+        """
+
+        with self.lock:
+            self.writes += 1
+            self.bytes_written += byte_count
+            self.write_seconds.observe(seconds)
+
+    def recordack(self, seconds, valid):
+        """
+        Records one slow mode response
+        :param seconds: Time from sending the command to its response
+        :param valid: False if the command was invalid
+        :return: None
+        """
+
+        with self.lock:
+            self.ack_seconds.observe(seconds)
+            if not valid:
+                self.invalid_commands += 1
+
+    def snapshot(self):
+        """
+        Gets every metric
+        :return: Dictionary of counters and histogram snapshots
+        """
+
+        with self.lock:
+            return {
+                "frames_sent": self.frames_sent,
+                "bytes_written": self.bytes_written,
+                "writes": self.writes,
+                "invalid_commands": self.invalid_commands,
+                "pixels_changed": self.pixels_changed.snapshot(),
+                "write_seconds": self.write_seconds.snapshot(),
+                "ack_seconds": self.ack_seconds.snapshot(),
+                "update_seconds": self.update_seconds.snapshot(),
+            }
+
+    def prometheus(self, prefix="lighting", labels=""):
+        """
+        Formats every metric in the Prometheus text format
+        :param prefix: Metric name prefix
+        :param labels: Extra labels such as 'port="/dev/ttyUSB0"'
+        :return: Text
+        """
+
+        snapshot = self.snapshot()
+        braces = "{%s}" % labels if labels else ""
+        separator = "," if labels else ""
+        lines = []
+
+        for name in ["frames_sent", "bytes_written", "writes", "invalid_commands"]:
+            lines.append("# TYPE %s_%s_total counter" % (prefix, name))
+            lines.append("%s_%s_total%s %d" % (prefix, name, braces, snapshot[name]))
+
+        for name in ["pixels_changed", "write_seconds", "ack_seconds", "update_seconds"]:
+
+            histogram = snapshot[name]
+            lines.append("# TYPE %s_%s histogram" % (prefix, name))
+
+            for bound, count in histogram["buckets"]:
+                bound = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append('%s_%s_bucket{%s%sle="%s"} %d' % (prefix, name, labels, separator, bound, count))
+
+            lines.append("%s_%s_sum%s %r" % (prefix, name, braces, histogram["sum"]))
+            lines.append("%s_%s_count%s %d" % (prefix, name, braces, histogram["count"]))
+
+        return "\n".join(lines) + "\n"
+
+
+# serial port wrapper that times writes, only swapped in while metrics are enabled
+class MeteredSerial:
+
+    def __init__(self, ser, metrics):
+
+        object.__setattr__(self, "ser", ser)
+        object.__setattr__(self, "metrics", metrics)
+
+    def __getattr__(self, name):
+
+        return getattr(self.ser, name)
+
+    def __setattr__(self, name, value):
+
+        setattr(self.ser, name, value)
+
+    def write(self, data):
+
+        start = time.perf_counter()
+        written = self.ser.write(data)
+        self.metrics.recordwrite(len(data), time.perf_counter() - start)
+        return written
+
+
+# writes metric snapshots to a file periodically
+class MetricsExporter:
+
+    # Formats
+    PROMETHEUS = "prometheus"
+    JSON_LINES = "jsonl"
+
+    def __init__(self, metrics, path, interval=10.0, export_format=PROMETHEUS, labels=""):
+        """
+        Constructor
+        :param metrics: ControllerMetrics to export
+        :param path: Prometheus text file, replaced each time, or JSON lines file, appended to
+        :param interval: Seconds between exports
+        :param export_format: PROMETHEUS or JSON_LINES
+        :param labels: Extra Prometheus labels
+        """
+
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.export_format = export_format
+        self.labels = labels
+
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def export(self):
+        """
+        Writes one snapshot
+        :return: None
+        """
+
+        if self.export_format == self.JSON_LINES:
+
+            snapshot = self.metrics.snapshot()
+            snapshot["timestamp"] = time.time()
+            with open(self.path, "a") as export_file:
+                export_file.write(json.dumps(snapshot) + "\n")
+
+            return
+
+        # Replace atomically so a scraper never reads half a file
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as export_file:
+            export_file.write(self.metrics.prometheus(labels=self.labels))
+
+        os.replace(temporary_path, self.path)
+
+    def start(self):
+        """
+        Starts exporting on a background thread
+        :return: None
+        """
+
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops exporting after a final export
+        :return: None
+        """
+
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        self.export()
+
+    def run(self):
+
+        while not self.stopped.wait(self.interval):
+            self.export()
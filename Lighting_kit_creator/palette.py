@@ -0,0 +1,83 @@
+from collections import OrderedDict
+
+
+# least recently used color table mirroring the device's palette slots
+class ColorPalette:
+
+    def __init__(self, size):
+        """
+        Constructor, the palette starts empty
+        :param size: Number of slots on the device
+        """
+
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets every slot, used when the device's palette can't be trusted anymore
+        :return: None
+        """
+
+        # Slots by color, least recently used first
+        self.slots = OrderedDict()
+        self.free = list(range(self.size - 1, -1, -1))
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def getstats(self):
+        """
+        Gets the statistics
+        :return: Dictionary of hits, misses and evictions
+        """
+
+        return {"size": self.size, "used": len(self.slots), "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
+
+    def countmisses(self, colors):
+        """
+        Counts the colors that would have to be uploaded, nothing changes
+        :param colors: Set of 24 bit colors
+        :return: Number of colors not in the palette, None if they can't all fit at once
+        """
+
+        if len(colors) > self.size:
+            return None
+
+        return sum(1 for color in colors if color not in self.slots)
+
+    def assign(self, colors):
+        """
+        Makes every color resident, evicting the least recently used colors the frame doesn't need
+        :param colors: Set of 24 bit colors, at most size of them
+        :return: Dictionary of slots by color, and list of (slot, color) to upload
+        """
+
+        slots = self.slots
+        missing = []
+        for color in colors:
+
+            # Touch the resident colors first so they are never evicted for this frame's misses
+            if color in slots:
+                slots.move_to_end(color)
+                self.hits += 1
+            else:
+                missing.append(color)
+
+        uploads = []
+        for color in missing:
+
+            if len(self.free) > 0:
+                slot = self.free.pop()
+            else:
+                evicted, slot = slots.popitem(last=False)
+                self.evictions += 1
+
+            slots[color] = slot
+            uploads.append((slot, color))
+            self.misses += 1
+
+        return slots, uploads
@@ -0,0 +1,55 @@
+# NumPy is optional, groups fall back to index lists
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# group of pixels that are always written together
+class PixelGroup:
+
+    def __init__(self, controller, indexes):
+        """
+        Constructor, the indexes are resolved once so writes only touch the group's pixels
+        :param controller: Anything with a length and setgroupcolor, such as a LightingController or ControllerGroup
+        :param indexes: The indexes of the pixels in the group
+        """
+
+        if controller.length is None:
+            raise ValueError("Set the controller's length before grouping its pixels")
+
+        self.controller = controller
+
+        # Pixels past the end of the strip are never shown
+        self.indexes = sorted(set(index for index in indexes if 0 <= index < controller.length))
+
+        # Contiguous groups are written with a single slice assignment
+        self.slice = None
+        if len(self.indexes) > 0 and self.indexes[-1] - self.indexes[0] + 1 == len(self.indexes):
+            self.slice = slice(self.indexes[0], self.indexes[-1] + 1)
+
+        # Scattered groups are written with one fancy index assignment by controllers with NumPy buffers
+        self.index_array = None
+        if numpy is not None:
+            self.index_array = numpy.array(self.indexes, dtype=numpy.intp)
+
+    def __len__(self):
+
+        return len(self.indexes)
+
+    def getindexes(self):
+        """
+        Gets the indexes of the pixels in the group
+        :return: Sorted list of indexes
+        """
+
+        return self.indexes
+
+    def setcolor(self, color):
+        """
+        Sets every pixel in the group to the color
+        :param color: 24 bit color value
+        :return: None
+        """
+
+        self.controller.setgroupcolor(self, color)
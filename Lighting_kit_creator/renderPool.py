@@ -0,0 +1,169 @@
+"""
+Renders CPU heavy effects in worker processes a few frames ahead of playback
+Workers write into shared memory slots laid out like a controller's pixel buffer, one 32 bit color per pixel,
+and frames come back in order as effects frames so they play with effects.play or a Compositor layer
+"""
+
+import colorsys
+import math
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from effects import Frame
+
+# Shared buffers hold colors the same way the pixel buffer does
+TYPECODE = "I"
+
+# Slots attached in a worker process as (shared memory, buffer), the shared memory keeps the mapping open
+attached_slots = {}
+
+
+def attachslots(names):
+    """
+    Attaches a worker process to the shared slots, runs once as each worker starts
+    :param names: Shared memory names in slot order
+    :return: None
+    """
+
+    for slot, name in enumerate(names):
+        memory = shared_memory.SharedMemory(name=name)
+        attached_slots[slot] = (memory, memory.buf.cast(TYPECODE))
+
+
+def renderslot(function, slot, number, length):
+    """
+    Renders one frame into a slot, runs in a worker process
+    :param function: Called with the slot's buffer, the frame number and the length, fills the first length colors
+    :param slot: Slot to render into
+    :param number: Frame number
+    :param length: Number of pixels
+    :return: Frame number
+    """
+
+    buffer = attached_slots[slot][1]
+    function(buffer, number, length)
+    return number
+
+
+def rainbow(buffer, number, length):
+    """
+    Render function, a rainbow scrolling along the strip
+    :param buffer: Colors to fill
+    :param number: Frame number
+    :param length: Number of pixels
+    :return: None
+    """
+
+    for pixel in range(length):
+        red, green, blue = colorsys.hsv_to_rgb(((pixel / length) + number * 0.01) % 1.0, 1.0, 1.0)
+        buffer[pixel] = (int(red * 0xFF) << 16) | (int(green * 0xFF) << 8) | int(blue * 0xFF)
+
+
+def plasma(buffer, number, length):
+    """
+    Render function, overlapping sine waves drifting at different speeds
+    :param buffer: Colors to fill
+    :param number: Frame number
+    :param length: Number of pixels
+    :return: None
+    """
+
+    phase = number * 0.05
+    for pixel in range(length):
+
+        position = pixel / 8.0
+        value = (math.sin(position + phase) + math.sin(position * 0.5 - phase * 1.3)
+                 + math.sin(math.hypot(position - 10.0, 5.0 * math.sin(phase * 0.2)) + phase)) / 3.0
+
+        red, green, blue = colorsys.hsv_to_rgb((value + 1.0) / 2.0, 1.0, 1.0)
+        buffer[pixel] = (int(red * 0xFF) << 16) | (int(green * 0xFF) << 8) | int(blue * 0xFF)
+
+
+# farms frame rendering out to worker processes and hands frames back in order
+class RenderPool:
+
+    def __init__(self, function, length, workers=None, ahead=None):
+        """
+        Constructor, starts the worker processes
+        :param function: Render function at module level so workers can import it, see renderslot
+        :param length: Number of pixels
+        :param workers: Worker processes, None for one per core
+        :param ahead: Frames rendered ahead of playback, None for two per worker
+        """
+
+        self.function = function
+        self.length = length
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if ahead is None:
+            ahead = 2 * workers
+
+        # One slot per frame in flight, each holds the whole strip
+        self.slots = [shared_memory.SharedMemory(create=True, size=array(TYPECODE).itemsize * max(length, 1))
+                      for count in range(ahead)]
+        self.buffers = [memory.buf.cast(TYPECODE) for memory in self.slots]
+
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=attachslots,
+                                        initargs=([memory.name for memory in self.slots],))
+
+    def close(self):
+        """
+        Stops the workers and frees the shared slots
+        :return: None
+        """
+
+        self.pool.shutdown(wait=True)
+
+        for buffer in self.buffers:
+            buffer.release()
+
+        for memory in self.slots:
+            memory.close()
+            memory.unlink()
+
+    def frames(self, count=None, duration=0.0, start=0):
+        """
+        Renders frames ahead and yields them in order
+        :param count: Number of frames, None for endless
+        :param duration: Seconds each frame is shown
+        :param start: First frame number
+        :return: Generator of effects frames
+        """
+
+        length = self.length
+        ahead = len(self.slots)
+        end = None if count is None else start + count
+
+        # Frames in flight by slot, a slot is reused once its frame is copied out
+        futures = [None] * ahead
+        number = start
+        while number < start + ahead and (end is None or number < end):
+            futures[number % ahead] = self.pool.submit(renderslot, self.function, number % ahead, number, length)
+            number += 1
+
+        try:
+            current = start
+            while end is None or current < end:
+
+                slot = current % ahead
+                futures[slot].result()
+                colors = self.buffers[slot][:length].tolist()
+
+                if end is None or number < end:
+                    futures[slot] = self.pool.submit(renderslot, self.function, slot, number, length)
+                    number += 1
+                else:
+                    futures[slot] = None
+
+                yield Frame(colors, duration)
+                current += 1
+
+        finally:
+
+            # Slots must not be rendered into after the generator is dropped, wait out frames already rendering
+            for future in futures:
+                if future is not None and not future.cancel():
+                    future.exception()
@@ -0,0 +1,184 @@
+import time
+
+
+# clock that jumps forward instead of sleeping, renders a show as fast as it can be computed
+class VirtualClock:
+
+    def __init__(self):
+
+        self.now = 0.0
+
+    def monotonic(self):
+        """
+        Gets the virtual time
+        :return: Seconds slept so far
+        """
+
+        return self.now
+
+    def sleep(self, seconds):
+        """
+        Moves the virtual time forward without waiting
+        :param seconds: Time to skip
+        :return: None
+        """
+
+        if seconds > 0:
+            self.now += seconds
+
+
+# runs frames against absolute deadlines so time spent sending never adds up
+class FrameScheduler:
+
+    def __init__(self, fps=None, clock=None):
+        """
+        Constructor, all deadlines are measured from start() so a whole show shares one clock
+        :param fps: Target frames per second for run(), timelines bring their own timestamps
+        :param clock: Object with monotonic() and sleep() such as VirtualClock, None for the time module
+        """
+
+        self.fps = fps
+        self.clock = time if clock is None else clock
+
+        # Show clock
+        self.origin = None
+        self.cursor = 0.0
+
+        # Statistics
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.max_late = 0.0
+
+    def start(self):
+        """
+        Starts the show clock and resets the statistics
+        :return: None
+        """
+
+        self.origin = self.clock.monotonic()
+        self.cursor = 0.0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.max_late = 0.0
+
+    def elapsed(self):
+        """
+        Gets the show time, starts the clock if it isn't running
+        :return: Seconds since start()
+        """
+
+        if self.origin is None:
+            self.start()
+
+        return self.clock.monotonic() - self.origin
+
+    def waituntil(self, show_time):
+        """
+        Sleeps until a show time
+        :param show_time: Seconds since start()
+        :return: How late it already was in seconds, 0.0 if on time
+        """
+
+        late = self.elapsed() - show_time
+        if late < 0:
+            self.clock.sleep(-late)
+            return 0.0
+
+        return late
+
+    def waitfor(self, timestamp, next_timestamp=None):
+        """
+        Waits for a frame's deadline, frames are stale once the next frame is already due
+        :param timestamp: Seconds from the cursor the frame is due
+        :param next_timestamp: Seconds from the cursor the next frame is due, None for the last frame
+        :return: True to send the frame, False to drop it
+        """
+
+        if next_timestamp is not None and self.elapsed() >= self.cursor + next_timestamp:
+            self.frames_dropped += 1
+            return False
+
+        late = self.waituntil(self.cursor + timestamp)
+        self.max_late = max(self.max_late, late)
+        self.frames_sent += 1
+        return True
+
+    def countframe(self):
+        """
+        Counts a frame sent without waitfor, such as an effect frame held with sleep
+        :return: None
+        """
+
+        self.frames_sent += 1
+
+    def advance(self, duration):
+        """
+        Moves the cursor forward, later timestamps are measured from the new position
+        :param duration: Seconds
+        :return: None
+        """
+
+        if self.origin is None:
+            self.start()
+
+        self.cursor += duration
+
+    def sleep(self, duration):
+        """
+        Drift free replacement for time.sleep, waits until duration after the last deadline
+        :param duration: Seconds
+        :return: None
+        """
+
+        self.advance(duration)
+        self.waituntil(self.cursor)
+
+    def run(self, render, frames=None, fps=None):
+        """
+        Calls render once per frame at the target fps, skipping frames that are already stale
+        :param render: Called with the frame number, returns False to stop
+        :param frames: Number of frames to run, None to run until render returns False
+        :param fps: Frames per second, None for the scheduler's
+        :return: None
+        """
+
+        period = 1.0 / (self.fps if fps is None else fps)
+        frame = 0
+        while frames is None or frame < frames:
+
+            # Skip ahead to the newest frame that is already due
+            due = int((self.elapsed() - self.cursor) / period)
+            if frames is not None:
+                due = min(due, frames - 1)
+
+            if due > frame:
+                self.frames_dropped += due - frame
+                frame = due
+
+            self.waitfor(frame * period)
+            frame += 1
+
+            if render(frame - 1) is False:
+                break
+
+        self.advance(frame * period)
+
+    def getstats(self):
+        """
+        Gets the achieved rate against the requested rate since start()
+        :return: Dictionary of statistics
+        """
+
+        elapsed = self.elapsed()
+        requested = self.frames_sent + self.frames_dropped
+
+        return {
+            "elapsed": elapsed,
+            "nominal": self.cursor,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "requested_fps": requested / elapsed if elapsed > 0 else 0.0,
+            "achieved_fps": self.frames_sent / elapsed if elapsed > 0 else 0.0,
+            "max_late": self.max_late,
+            "drift": elapsed - self.cursor,
+        }
@@ -0,0 +1,281 @@
+"""
+Show files, frames recorded from a controller once and replayed cheaply later
+File: header, then one record per frame of a timestamp followed by a frame command packet
+(see LightingController.COM_FRAME) holding only the span of pixels that changed since the previous frame
+"""
+
+import mmap
+import time
+from array import array
+from struct import Struct
+from frameEncoder import FrameEncoder
+from scheduler import FrameScheduler
+
+# File layout
+# Header: magic, version, flags, strip length, frame count, duration in milliseconds
+SHOW_HEADER = Struct(">6sBBHII")
+SHOW_MAGIC = b"LKSHOW"
+SHOW_VERSION = 1
+
+# Record: timestamp in milliseconds since the recording started, then the packet
+FRAME_TIMESTAMP = Struct(">I")
+
+# Packet: marker and body length, then start, count and packed colors
+PACKET_HEADER = Struct(">BH")
+PACKET_SPAN = Struct(">BB")
+
+MAXLEDS = 255
+
+
+# serial port stand in for recording without a device, acknowledges every command
+class NullSerial:
+
+    def __init__(self, response=b"COMMAND_RECEIVED\n"):
+
+        self.response = response
+        self.timeout = None
+        self.port = None
+
+    def write(self, data):
+
+        return len(data)
+
+    def readline(self):
+
+        return self.response
+
+    def open(self):
+
+        return
+
+    def close(self):
+
+        return
+
+
+# captures every frame a controller shows into a show file
+class ShowRecorder:
+
+    def __init__(self, path, clock=None):
+        """
+        Constructor
+        :param path: Show file to write
+        :param clock: Object with monotonic() such as VirtualClock, share it with the show's scheduler
+        """
+
+        self.path = path
+        self.clock = time if clock is None else clock
+        self.encoder = FrameEncoder(MAXLEDS)
+
+        # Recording state
+        self.file = None
+        self.controller = None
+        self.serial = None
+        self.origin = None
+        self.previous = None
+        self.frame_count = 0
+
+    def start(self, controller, offline=False):
+        """
+        Starts recording every update the controller sends
+        :param controller: LightingController
+        :param offline: True to swap the port for a NullSerial so no device is needed
+        :return: None
+        """
+
+        # Frame packets address pixels with 1 byte
+        if controller.length > MAXLEDS:
+            raise ValueError("Show files hold at most %d pixels, not %d" % (MAXLEDS, controller.length))
+
+        self.file = open(self.path, "wb")
+        self.file.write(SHOW_HEADER.pack(SHOW_MAGIC, SHOW_VERSION, 0, controller.length, 0, 0))
+
+        self.controller = controller
+        if offline:
+            self.serial = controller.ser
+            controller.ser = NullSerial(controller.COM_RECEIVED)
+
+        self.origin = self.clock.monotonic()
+        self.previous = None
+        self.frame_count = 0
+        controller.recorder = self
+
+    def recordframe(self, pixel_buffer):
+        """
+        Appends the pixels that changed since the last frame, called by the controller on each update
+        :param pixel_buffer: The controller's pixel buffer, before brightness and gamma so playback corrects them once
+        :return: None
+        """
+
+        length = self.controller.length
+        current = array("I", pixel_buffer[:length])
+
+        # The first frame holds the whole strip so playback doesn't depend on what was shown before
+        if self.previous is None:
+            start = 0
+            end = length
+
+        else:
+
+            changed = [count for count, (pixel, record) in enumerate(zip(current, self.previous)) if pixel != record]
+            if len(changed) == 0:
+                start = 0
+                end = 0
+            else:
+                start = changed[0]
+                end = changed[-1] + 1
+
+        timestamp = int(round((self.clock.monotonic() - self.origin) * 1000))
+        self.file.write(FRAME_TIMESTAMP.pack(timestamp))
+        self.file.write(self.encoder.encodeframe(current, start, end))
+
+        self.previous = current
+        self.frame_count += 1
+
+    def stop(self):
+        """
+        Stops recording and completes the header
+        :return: Number of frames recorded
+        """
+
+        self.controller.recorder = None
+        if self.serial is not None:
+            self.controller.ser = self.serial
+            self.serial = None
+
+        duration = int(round((self.clock.monotonic() - self.origin) * 1000))
+        self.file.seek(0)
+        self.file.write(SHOW_HEADER.pack(SHOW_MAGIC, SHOW_VERSION, 0, self.controller.length, self.frame_count,
+                                         duration))
+        self.file.close()
+        self.file = None
+
+        return self.frame_count
+
+
+# plays a show file, in fast mode the packets go from the mapped file straight to the port
+class ShowPlayer:
+
+    def __init__(self, path):
+        """
+        Constructor, maps the file and indexes its frames
+        :param path: Show file to play
+        """
+
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+        magic, version, flags, self.length, self.frame_count, duration = SHOW_HEADER.unpack_from(self.map, 0)
+        if magic != SHOW_MAGIC or version != SHOW_VERSION:
+            self.close()
+            raise ValueError("Not a version %d show file: %s" % (SHOW_VERSION, path))
+
+        self.duration = duration / 1000.0
+
+        # Frames as (timestamp, packet start, packet end), only headers are read
+        self.frames = []
+        self.largest_packet = 0
+        position = SHOW_HEADER.size
+        while len(self.frames) < self.frame_count:
+
+            timestamp, = FRAME_TIMESTAMP.unpack_from(self.map, position)
+            start = position + FRAME_TIMESTAMP.size
+            marker, body_length = PACKET_HEADER.unpack_from(self.map, start)
+            position = start + PACKET_HEADER.size + body_length
+            self.frames.append((timestamp / 1000.0, start, position))
+            self.largest_packet = max(self.largest_packet, position - start)
+
+    def close(self):
+        """
+        Unmaps and closes the file
+        :return: None
+        """
+
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+    def decodeframe(self, frame):
+        """
+        Unpacks a frame's pixels
+        :param frame: Frame number
+        :return: List of indexes and list of 24 bit colors
+        """
+
+        timestamp, start, end = self.frames[frame]
+        first, count = PACKET_SPAN.unpack_from(self.map, start + PACKET_HEADER.size)
+
+        position = start + PACKET_HEADER.size + PACKET_SPAN.size
+        data = self.map[position:end]
+        colors = [int.from_bytes(data[offset:offset + 3], "big") for offset in range(0, 3 * count, 3)]
+
+        return list(range(first, first + count)), colors
+
+    def finalcolors(self):
+        """
+        Gets what the strip shows after the last frame, later frames are read first until every pixel is known
+        :return: List of indexes and list of 24 bit colors
+        """
+
+        colors = [None] * self.length
+        remaining = self.length
+        frame = self.frame_count - 1
+        while remaining > 0 and frame >= 0:
+
+            indexes, frame_colors = self.decodeframe(frame)
+            for index, color in zip(indexes, frame_colors):
+
+                if colors[index] is None:
+                    colors[index] = color
+                    remaining -= 1
+
+            frame -= 1
+
+        indexes = [index for index, color in enumerate(colors) if color is not None]
+        return indexes, [colors[index] for index in indexes]
+
+    def play(self, controller, scheduler=None):
+        """
+        Plays every frame at its timestamp, late frames are sent late rather than dropped since each holds a delta
+        :param controller: Started LightingController at least as long as the show
+        :param scheduler: FrameScheduler to play on, None to start a new one
+        :return: None
+        """
+
+        if scheduler is None:
+            scheduler = FrameScheduler()
+            scheduler.start()
+
+        # Fast mode firmware understands frame packets, so nothing is decoded, unless the packets have to go through
+        # the controller to be corrected, numbered, queued for the writer thread, measured, recorded or split to fit
+        # the device's receive buffer
+        if (controller.fast_mode and not controller.correcting and not controller.reliable_mode
+                and controller.writer_thread is None and controller.metrics is None and controller.recorder is None
+                and self.largest_packet <= controller.receive_buffer):
+
+            view = self.view
+            write = controller.ser.write
+            for timestamp, start, end in self.frames:
+                scheduler.waitfor(timestamp)
+                write(view[start:end])
+
+            # The buffers follow the strip, pixels set before the show and not sent yet go out with the next update
+            indexes, colors = self.finalcolors()
+            controller.setpixelcolors(indexes, colors)
+
+            record_buffer = controller.record_buffer
+            for index, color in zip(indexes, colors):
+                record_buffer[index] = color
+
+        else:
+
+            frame = 0
+            while frame < self.frame_count:
+                indexes, colors = self.decodeframe(frame)
+                scheduler.waitfor(self.frames[frame][0])
+                controller.setpixelcolors(indexes, colors)
+                controller.updatepixels()
+                frame += 1
+
+        scheduler.sleep(self.duration)
@@ -0,0 +1,262 @@
+from array import array
+from collections import namedtuple
+import RGB
+from scheduler import FrameScheduler
+
+# Pixels no track drives yet compare unequal to every 24 bit color
+UNSENT = 0xFFFFFFFF
+
+# Frame of a compiled timeline, the pixels that changed and the command that sends them, None to send them the usual way
+CompiledFrame = namedtuple("CompiledFrame", ["timestamp", "indexes", "colors", "data"])
+
+# Keyframe of a track, easing shapes the transition from the previous keyframe
+Keyframe = namedtuple("Keyframe", ["timestamp", "color", "easing"])
+
+
+def linear(progress):
+    """
+    Constant speed transition
+    :param progress: 0.0 to 1.0 through the transition
+    :return: Eased progress
+    """
+
+    return progress
+
+
+def easein(progress):
+    """
+    Transition that starts slow and speeds up
+    :param progress: 0.0 to 1.0 through the transition
+    :return: Eased progress
+    """
+
+    return progress * progress
+
+
+def easeout(progress):
+    """
+    Transition that starts fast and slows down
+    :param progress: 0.0 to 1.0 through the transition
+    :return: Eased progress
+    """
+
+    return progress * (2.0 - progress)
+
+
+def easeinout(progress):
+    """
+    Transition that is slow at both ends
+    :param progress: 0.0 to 1.0 through the transition
+    :return: Eased progress
+    """
+
+    return progress * progress * (3.0 - 2.0 * progress)
+
+
+def step(progress):
+    """
+    Holds the previous color until the keyframe, then jumps
+    :param progress: 0.0 to 1.0 through the transition
+    :return: Eased progress
+    """
+
+    return 1.0 if progress >= 1.0 else 0.0
+
+
+def interpolate(start_color, end_color, progress):
+    """
+    Interpolates each component between two colors
+    :param start_color: 24 bit color at progress 0.0
+    :param end_color: 24 bit color at progress 1.0
+    :param progress: Eased progress
+    :return: 24 bit color
+    """
+
+    color = 0
+    for shift in (RGB.RED_SHIFT, RGB.GREEN_SHIFT, RGB.BLUE_SHIFT):
+
+        start = (start_color >> shift) & RGB.COMPONENT_MAX
+        end = (end_color >> shift) & RGB.COMPONENT_MAX
+        color |= int(round(start + (end - start) * progress)) << shift
+
+    return color
+
+
+class Timeline:
+
+    # Constants
+    DEFAULT_FPS = 40
+
+    def __init__(self, fps=DEFAULT_FPS, duration=0.0):
+        """
+        Constructor, a timeline is a set of keyframe tracks, one per pixel group
+        :param fps: Frames per second the timeline is compiled at
+        :param duration: Minimum length in seconds, playback holds until it ends
+        """
+
+        self.fps = fps
+        self.duration = duration
+
+        # Tracks as [group, keyframes] in the order they were added
+        self.tracks = []
+
+        # Compiled frames by controller mode
+        self.compiled = {}
+
+    def addkeyframe(self, group, timestamp, color, easing=linear):
+        """
+        Adds a keyframe, the group reaches the color at the timestamp
+        :param group: PixelGroup the keyframe applies to
+        :param timestamp: Seconds from the start of the timeline
+        :param color: 24 bit color value
+        :param easing: Shape of the transition from the previous keyframe
+        :return: None
+        """
+
+        keyframes = None
+        for track in self.tracks:
+
+            if track[0] is group:
+                keyframes = track[1]
+
+        if keyframes is None:
+            keyframes = []
+            self.tracks.append([group, keyframes])
+
+        # Sorting is stable so keyframes at the same time stay in the order they were added
+        keyframes.append(Keyframe(timestamp, color & RGB.BIT24, easing))
+        keyframes.sort(key=lambda keyframe: keyframe.timestamp)
+
+        self.duration = max(self.duration, timestamp)
+        self.compiled = {}
+
+    def colorat(self, keyframes, timestamp):
+        """
+        Gets a track's color at a point in time
+        :param keyframes: Sorted keyframes of the track
+        :param timestamp: Seconds from the start of the timeline
+        :return: 24 bit color, None before the first keyframe
+        """
+
+        previous = None
+        for keyframe in keyframes:
+
+            if keyframe.timestamp > timestamp:
+
+                if previous is None:
+                    return None
+
+                progress = (timestamp - previous.timestamp) / (keyframe.timestamp - previous.timestamp)
+                return interpolate(previous.color, keyframe.color, keyframe.easing(progress))
+
+            previous = keyframe
+
+        return previous.color
+
+    def timestamps(self):
+        """
+        Gets the time of every frame
+        :return: List of seconds from the start of the timeline
+        """
+
+        timestamps = []
+        count = 0
+        while count / self.fps < self.duration:
+            timestamps.append(count / self.fps)
+            count += 1
+
+        timestamps.append(self.duration)
+        return timestamps
+
+    def compile(self, controller):
+        """
+        Computes and encodes every frame for the controller's current mode, results are cached
+        :param controller: LightingController the timeline will be played on
+        :return: List of CompiledFrame
+        """
+
+        mode = (controller.fast_mode, controller.frame_mode, controller.palette_mode, controller.reliable_mode,
+                controller.length)
+        if mode in self.compiled:
+            return self.compiled[mode]
+
+        # Only colors the tracks set are compiled, other pixels keep whatever they show when the timeline plays
+        length = controller.length
+        current = array("I", [UNSENT]) * length
+        previous = array("I", [UNSENT]) * length
+
+        tracked = set()
+        for group, keyframes in self.tracks:
+            tracked.update(group.getindexes())
+        tracked = sorted(tracked)
+
+        frames = []
+        for timestamp in self.timestamps():
+
+            # Later tracks win where groups overlap
+            for group, keyframes in self.tracks:
+
+                color = self.colorat(keyframes, timestamp)
+                if color is None:
+                    continue
+
+                for index in group.getindexes():
+                    current[index] = color
+
+            indexes = [index for index in tracked if current[index] != previous[index]]
+            if len(indexes) == 0:
+                continue
+
+            colors = [current[index] for index in indexes]
+
+            # A frame packet covers every pixel from the first change to the last, it can only be
+            # precompiled when the tracks drive all of them, otherwise the frame is sent the usual way
+            data = None
+            if not controller.frame_mode or UNSENT not in current[indexes[0]:indexes[-1] + 1]:
+                data = controller.encodepixels(current, indexes)
+
+            frames.append(CompiledFrame(timestamp, indexes, colors, data))
+
+            for index, color in zip(indexes, colors):
+                previous[index] = color
+
+        self.compiled[mode] = frames
+        return frames
+
+    def play(self, controller, scheduler=None):
+        """
+        Plays the timeline, frames are sent at their timestamps and nothing is computed while playing
+        :param controller: LightingController to play on
+        :param scheduler: FrameScheduler to play on, None to start a new one
+        :return: None
+        """
+
+        frames = self.compile(controller)
+
+        if scheduler is None:
+            scheduler = FrameScheduler(self.fps)
+            scheduler.start()
+
+        dropped = False
+        for count, frame in enumerate(frames):
+
+            next_timestamp = None
+            if count + 1 < len(frames):
+                next_timestamp = frames[count + 1].timestamp
+
+            # Stale frames are skipped but their colors go out with the next frame
+            if not scheduler.waitfor(frame.timestamp, next_timestamp):
+                controller.setpixelcolors(frame.indexes, frame.colors)
+                dropped = True
+                continue
+
+            # Precompiled commands only carry their own frame's changes
+            if dropped:
+                controller.sendframe(frame.indexes, frame.colors)
+                dropped = False
+
+            else:
+                controller.sendframe(frame.indexes, frame.colors, frame.data)
+
+        # Hold until the end of the timeline
+        scheduler.sleep(self.duration)
@@ -0,0 +1,203 @@
+# plans the cheapest set of commands for an update from the pixels that changed
+class UpdatePlanner:
+
+    # Wire cost of a slow mode round trip, in bytes of line time
+    ROUND_TRIP_BYTES = 64
+
+    def __init__(self, encoder):
+        """
+        Constructor
+        :param encoder: FrameEncoder the plans are encoded with
+        """
+
+        self.encoder = encoder
+
+        # Encoded command sizes
+        self.set_one_bytes = len(encoder.SLOW_COMMAND)
+        self.set_many_bytes = len(encoder.MANY_COMMAND)
+        self.fast_line_bytes = encoder.line_length
+        self.frame_header_bytes = encoder.WIDE_FRAME_HEADER.size if encoder.wide else encoder.FRAME_HEADER.size
+        self.palette_header_bytes = encoder.PALETTE_HEADER.size
+        self.palette_entry_bytes = encoder.PALETTE_ENTRY.size
+
+        self.resetstats()
+
+    def resetstats(self):
+        """
+        Clears the statistics
+        :return: None
+        """
+
+        self.stats = {
+            "slow_plans": 0,
+            "set_one": 0,
+            "set_many": 0,
+            "set_many_pixels": 0,
+            "frame_plans": 0,
+            "frames": 0,
+            "fast_lines": 0,
+            "palette_plans": 0,
+            "palette_frames": 0,
+            "palette_entries": 0,
+            "commands_saved": 0,
+            "bytes_saved": 0,
+        }
+
+    def getstats(self):
+        """
+        Gets the statistics
+        :return: Dictionary of how often each command was chosen and what it saved
+        """
+
+        return dict(self.stats)
+
+    def slowcost(self, commands, byte_count):
+        """
+        Gets the cost of a slow mode plan
+        :param commands: Number of commands, each waits on a response
+        :param byte_count: Bytes sent
+        :return: Cost in bytes
+        """
+
+        return commands * self.ROUND_TRIP_BYTES + byte_count
+
+    def framecost(self, count):
+        """
+        Gets the size of a frame command, wide frames take a header per chunk
+        :param count: Pixels in the frame
+        :return: Bytes
+        """
+
+        return self.frame_header_bytes * self.encoder.countchunks(count) + 3 * count
+
+    def planslow(self, colors, changed, length):
+        """
+        Plans slow mode commands, runs of one color become a single SET_MANY
+        :param colors: Pixel buffer
+        :param changed: Sorted indexes of the pixels that changed
+        :param length: Strip length, runs never pass it
+        :return: List of encoded commands
+        """
+
+        encoder = self.encoder
+        stats = self.stats
+        commands = []
+        set_one = 0
+        set_many = 0
+
+        position = 0
+        while position < len(changed):
+
+            start = changed[position]
+            color = colors[start]
+
+            # Unchanged pixels that already have the color can be set again for free
+            end = start + 1
+            while end < length and colors[end] == color:
+                end += 1
+
+            # Changed pixels the run covers
+            covered = position + 1
+            while covered < len(changed) and changed[covered] < end:
+                covered += 1
+
+            count = end - start
+            one_cost = self.slowcost(covered - position, self.set_one_bytes * (covered - position))
+            many_cost = self.slowcost(1, self.set_many_bytes)
+
+            if covered - position > 1 and many_cost < one_cost:
+                commands.append(encoder.encodemany(start, color, count))
+                set_many += 1
+                stats["set_many_pixels"] += count
+                position = covered
+
+            else:
+                commands.append(encoder.encodeslow(start, color))
+                set_one += 1
+                position += 1
+
+        stats["slow_plans"] += 1
+        stats["set_one"] += set_one
+        stats["set_many"] += set_many
+        stats["commands_saved"] += len(changed) - len(commands)
+        stats["bytes_saved"] += (self.set_one_bytes * len(changed) - self.set_one_bytes * set_one
+                                 - self.set_many_bytes * set_many)
+
+        return commands
+
+    def planframe(self, colors, changed):
+        """
+        Plans a fast mode update that shows on arrival, one frame command or fast lines, whichever is smaller
+        :param colors: Pixel buffer
+        :param changed: Sorted indexes of the pixels that changed
+        :return: Encoded update
+        """
+
+        stats = self.stats
+        stats["frame_plans"] += 1
+
+        if len(changed) == 0:
+            start = 0
+            end = 0
+        else:
+            start = changed[0]
+            end = changed[-1] + 1
+
+        frame_bytes = self.framecost(end - start)
+        lines_bytes = self.fast_line_bytes * len(changed) + len(self.encoder.show_command)
+
+        # Scattered changes are cheaper as lines than as a frame spanning the gaps between them
+        if lines_bytes < frame_bytes:
+            stats["fast_lines"] += 1
+            stats["bytes_saved"] += frame_bytes - lines_bytes
+            return self.encoder.encodefast(colors, changed)
+
+        stats["frames"] += 1
+        return self.encoder.encodeframe(colors, start, end)
+
+    def planpalette(self, colors, changed, palette):
+        """
+        Plans a fast mode update as palette indexes, uploading missing colors first, or as planframe when smaller
+        :param colors: Pixel buffer
+        :param changed: Sorted indexes of the pixels that changed
+        :param palette: ColorPalette mirroring the device
+        :return: Encoded update
+        """
+
+        stats = self.stats
+        stats["palette_plans"] += 1
+
+        # Indexed frames only address 255 pixels
+        if len(changed) == 0 or self.encoder.wide:
+            return self.planframe(colors, changed)
+
+        start = changed[0]
+        end = changed[-1] + 1
+        distinct = set(colors[start:end].tolist())
+
+        # Frames with more colors than slots can't be indexed
+        misses = palette.countmisses(distinct)
+        if misses is None:
+            return self.planframe(colors, changed)
+
+        palette_bytes = self.frame_header_bytes + (end - start)
+        if misses > 0:
+            palette_bytes += self.palette_header_bytes + self.palette_entry_bytes * misses
+
+        frame_bytes = min(self.framecost(end - start),
+                          self.fast_line_bytes * len(changed) + len(self.encoder.show_command))
+        if frame_bytes <= palette_bytes:
+            return self.planframe(colors, changed)
+
+        slots, uploads = palette.assign(distinct)
+        data = bytearray()
+        if len(uploads) > 0:
+            data += self.encoder.encodepalette(uploads)
+
+        data += self.encoder.encodeindexed(colors, start, end, slots)
+
+        stats["palette_frames"] += 1
+        stats["palette_entries"] += len(uploads)
+        stats["bytes_saved"] += frame_bytes - palette_bytes
+
+        return data